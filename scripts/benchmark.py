@@ -0,0 +1,203 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # headless, the slicer is only timed, never shown
+from pathlib import Path
+from utils.synthetic import write_synthetic_segy
+from utils.loading import segy2npy
+from utils.stats import StreamingStats, amplitude_percentile
+from utils.horizons import parse_horizon_file, HorizonPickIndex
+from utils.visualization import plot_section_slices, plot_depth_slice, extract_section_picks, StitchedSection
+
+# survey sizes (inlines, crosslines, samples) selectable with --size
+SIZES = {'small': (100, 150, 250), 'medium': (400, 500, 750), 'large': (1000, 1200, 1500)}
+
+
+def summarize(durations):
+    """function returns the number of runs and the min, mean, median and 95th percentile of durations in seconds"""
+    durations = np.asarray(durations, dtype=np.float64)
+    return {'n': int(durations.size), 'min_s': float(durations.min()), 'mean_s': float(durations.mean()),
+            'median_s': float(np.median(durations)), 'p95_s': float(np.percentile(durations, 95))}
+
+
+def time_calls(function, arguments, repeat=1):
+    """function times function(*args) for every args in arguments, repeat times over, and returns the summary"""
+    durations = []
+    for _ in range(repeat):
+        for args in arguments:
+            start = time.perf_counter()
+            function(*args)
+            durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def git_revision():
+    """function returns the commit hash of the checkout the benchmark runs from, or None outside of git"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=str(Path(__file__).parent),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(segy_path, horizon_paths, repeat=5, n_positions=50, workers=1, seed=0):
+    """function times ingest, statistics, slice extraction, horizon extraction and headless slicer updates on the
+    given survey
+
+    Returns
+    -------
+    results: dict
+        timing summary of every benchmark keyed by its name
+    """
+
+    rng = np.random.RandomState(seed)
+    results = {}
+
+    # ingest
+    print("Benchmarking ingest...")
+    with contextlib.redirect_stdout(io.StringIO()):
+        results['ingest'] = time_calls(segy2npy, [(str(segy_path), 1)], repeat=1)
+        if workers > 1:
+            results['ingest_parallel'] = time_calls(segy2npy, [(str(segy_path), workers)], repeat=1)
+        seismic, ilines, xlines, samples = segy2npy(str(segy_path), workers)
+    nil, nxl, nz = seismic.shape
+
+    # statistics of the full cube and percentile lookups
+    print("Benchmarking statistics...")
+
+    def cube_stats():
+        limit = float(np.abs(seismic).max())
+        stats = StreamingStats(-limit, limit)
+        for start in range(0, nil, 64):
+            stats.update(seismic[start:start + 64])
+        return amplitude_percentile(stats.to_dict(), [1, 99])
+
+    results['stats'] = time_calls(cube_stats, [()], repeat)
+
+    # slice extraction at random positions
+    print("Benchmarking slice extraction...")
+    il_positions = rng.randint(0, nil, n_positions)
+    xl_positions = rng.randint(0, nxl, n_positions)
+    z_positions = rng.randint(0, nz, n_positions)
+    section_positions = list(zip(il_positions, xl_positions))
+    results['section_slice'] = time_calls(lambda i, j: plot_section_slices(seismic, i, j), section_positions, repeat)
+    section = StitchedSection(seismic)
+    results['section_slice_buffered'] = time_calls(section.update, section_positions, repeat)
+    results['depth_slice'] = time_calls(lambda k: np.array(plot_depth_slice(seismic, k)), [(k,) for k in z_positions],
+                                        repeat)
+
+    # horizon parsing, indexing and lookups
+    if horizon_paths:
+        print("Benchmarking horizon extraction...")
+        results['horizon_parse'] = time_calls(parse_horizon_file, [(path,) for path in horizon_paths], 1)
+        picks = parse_horizon_file(horizon_paths[0])
+        picks = (picks[:, 0], picks[:, 1], picks[:, 2])
+        results['horizon_index'] = time_calls(lambda: HorizonPickIndex(ilines, xlines, samples, *picks), [()], repeat)
+        index = HorizonPickIndex(ilines, xlines, samples, *picks)
+        results['horizon_section_picks'] = time_calls(index.section_picks, section_positions, repeat)
+        results['horizon_extract_section_picks'] = time_calls(
+            lambda i, j: extract_section_picks(ilines, xlines, samples, *picks, i, j), section_positions[:5], 1)
+
+    # slider updates of the interactive slicer, with and without drawing the figure
+    print("Benchmarking slicer updates...")
+    from seismic_slicer import SeismicSlicer
+    with contextlib.redirect_stdout(io.StringIO()):
+        horizon_path = str(Path(horizon_paths[0]).parent) if horizon_paths else None
+        slicer = SeismicSlicer(str(segy_path), horizon_file_path=horizon_path, cmap=None, workers=workers)
+        sliders = [(slicer.frame_slider1, il_positions), (slicer.frame_slider2, xl_positions),
+                   (slicer.frame_slider3, z_positions)]
+        moves = [(slider, positions[k]) for k in range(n_positions) for slider, positions in sliders]
+
+        def move_and_draw(slider, value):
+            slider.set_val(value)
+            slicer.fig.canvas.draw()
+
+        results['slicer_update'] = time_calls(lambda slider, value: slider.set_val(value), moves, repeat)
+        results['slicer_update_draw'] = time_calls(move_and_draw, moves, 1)
+
+    return results
+
+
+def compare_results(results, baseline):
+    """function prints the median duration of every benchmark relative to a baseline run"""
+    print('{:<32}{:>14}{:>14}{:>10}'.format('benchmark', 'baseline [ms]', 'current [ms]', 'ratio'))
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['median_s'], summary['median_s']
+        print('{:<32}{:>14.3f}{:>14.3f}{:>10.2f}'.format(name, before * 1e3, after * 1e3, after / before if before else
+                                                          float('nan')))
+
+
+def main():
+    # Create ArgumentParser object
+    parser = argparse.ArgumentParser(description='Benchmark SeisWiz on a synthetic SEG-Y survey')
+
+    # Add arguments
+    parser.add_argument('--size', default='small', choices=sorted(SIZES), help='Size of the synthetic survey')
+    parser.add_argument('--shape', type=int, nargs=3, metavar=('NIL', 'NXL', 'NZ'), required=False, help='Number of inlines, crosslines and samples of the synthetic survey, overrides --size')
+    parser.add_argument('--missing_traces', type=float, default=0.05, help='Fraction of traces dropped at random')
+    parser.add_argument('--missing_lines', type=int, default=2, help='Number of inlines and of crosslines dropped from the survey')
+    parser.add_argument('--sorted', action='store_true', help='Write traces sorted by inline and crossline instead of in random order')
+    parser.add_argument('--horizons', type=int, default=3, help='Number of synthetic horizon files')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of times every timed operation is repeated')
+    parser.add_argument('--positions', type=int, default=50, help='Number of random slice positions timed')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes used for parallel ingest')
+    parser.add_argument('--data_dir', required=False, help='Directory to write the synthetic survey into, a temporary directory is used if not given')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='Path of the JSON file to write the results into')
+    parser.add_argument('--compare', required=False, help='JSON results of an earlier run to compare against')
+
+    # Parse the command line arguments
+    args = parser.parse_args()
+    nil, nxl, nz = args.shape if args.shape is not None else SIZES[args.size]
+    config = {'shape': [nil, nxl, nz], 'missing_traces': args.missing_traces, 'missing_lines': args.missing_lines,
+              'shuffled': not args.sorted, 'horizons': args.horizons, 'repeat': args.repeat,
+              'positions': args.positions, 'workers': args.workers}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(args.data_dir or tmp_dir)
+        data_dir.mkdir(parents=True, exist_ok=True)
+
+        print("Generating synthetic survey of {} x {} x {} samples...".format(nil, nxl, nz))
+        segy_path = data_dir / 'synthetic.sgy'
+        info = write_synthetic_segy(segy_path, nil, nxl, nz, missing_traces=args.missing_traces,
+                                    missing_ilines=args.missing_lines, missing_xlines=args.missing_lines,
+                                    shuffle=not args.sorted, n_horizons=args.horizons,
+                                    horizon_dir=data_dir / 'horizons')
+
+        results = run_benchmarks(segy_path, info['horizon_paths'], args.repeat, args.positions, args.workers)
+
+    report = {'meta': {'revision': git_revision(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(), 'numpy': np.__version__,
+                       'matplotlib': matplotlib.__version__, 'platform': platform.platform(),
+                       'cpus': os.cpu_count(), 'n_traces': info['n_traces']},
+              'config': config,
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results written to {}".format(args.output))
+
+    for name, summary in results.items():
+        print('{:<32}median {:>10.3f} ms   p95 {:>10.3f} ms'.format(name, summary['median_s'] * 1e3,
+                                                                   summary['p95_s'] * 1e3))
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print("Warning: baseline was run with a different configuration {}".format(baseline.get('config')),
+                  file=sys.stderr)
+        compare_results(results, baseline['results'])
+
+
+if __name__ == "__main__":
+    main()
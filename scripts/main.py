@@ -1,5 +1,5 @@
 import argparse
-from seismic_slicer import SeismicSlicer
+from utils.constants import STORAGE_DTYPES, EXPORT_FORMATS, HORIZON_STATISTICS, ATTRIBUTES
 
 
 def main():
@@ -10,20 +10,111 @@ def main():
     parser.add_argument('-i', '--input_file', required=True, help='Path to the configuration file')
     parser.add_argument('-hor', '--horizon_path', required=False, help='Path to a specific horizon picks file or a directory containing multiple horizon files')
     parser.add_argument('-cmap', '--color_map', required=False, help='Colormap to render the seismic data. Must be a matplotlib compatible.')
+    parser.add_argument('--clip_mode', default='std', choices=('std', 'percentile'), help='Clip the seismic images at multiples of the amplitude standard deviation or at amplitude percentiles')
+    parser.add_argument('--dtype', default='float32', choices=STORAGE_DTYPES, help='Data type to store the seismic volume in. int16 and int8 quantize amplitudes with a per-volume scale, float16 scales them if they exceed its range')
+    parser.add_argument('--workers', type=int, required=False, help='Number of processes decoding the segy file and horizon files and rendering exported slices in parallel. The segy file is decoded by a single process, horizon files and exported slices by one process per CPU if not specified')
+    parser.add_argument('--lazy', action='store_true', help='Read traces from the segy file on demand instead of loading the whole volume into memory. Cannot be combined with --dtype, -cache, --workers greater than 1 or --brick_size')
+    parser.add_argument('--slice_cache_mb', type=float, required=False, help='Memory budget in MB of the slice cache used in lazy mode')
+    parser.add_argument('--prefetch', type=int, required=False, help='Number of slices loaded in the background ahead of a moving slider in lazy or bricked mode (default 4, 0 disables prefetching)')
+    parser.add_argument('--prefetch_mb', type=float, required=False, help='Memory budget in MB of the slices loaded ahead along one direction')
+    parser.add_argument('--brick_size', type=int, required=False, help='Convert the segy file into cubic bricks of this edge length (e.g. 64) stored in the cache directory, so that inline, crossline and depth slices load equally fast')
+    parser.add_argument('-cache', '--cache_dir', required=False, help='Directory to cache parsed seismic cubes in. Reopening an unchanged segy file then memory-maps the cached cube instead of re-parsing it')
+    parser.add_argument('--rebuild_cache', action='store_true', help='Re-parse the segy file even if a valid cache entry exists')
+    parser.add_argument('--attribute', default='amplitude', choices=ATTRIBUTES, help='Seismic attribute to show, computed only for the slices on display. Press n in the window to switch to the next attribute')
+    parser.add_argument('--attribute_window', type=int, required=False, help='Length in samples of the sliding window of the RMS amplitude attribute (default 9)')
+    parser.add_argument('--attribute_cache_mb', type=float, required=False, help='Memory budget in MB of the cache of computed attribute slices (default 256)')
+    parser.add_argument('--horizon_map', nargs='?', const=True, metavar='FILE_NAME', required=False, help='Show the amplitudes along the horizon with this file name (the first horizon if no name is given) in the depth view, flattened on the horizon so that the depth slider moves parallel to it')
+    parser.add_argument('--horizon_window', type=int, default=0, help='Half-length in samples of the window around the horizon the horizon map is computed over')
+    parser.add_argument('--horizon_statistic', default='mean', choices=HORIZON_STATISTICS, help='Statistic of the samples inside the window around the horizon shown on the horizon map')
+    parser.add_argument('--roi_inlines', type=float, nargs=2, metavar=('FIRST', 'LAST'), required=False, help='Only load the inlines numbered FIRST to LAST of the segy file')
+    parser.add_argument('--roi_crosslines', type=float, nargs=2, metavar=('FIRST', 'LAST'), required=False, help='Only load the crosslines numbered FIRST to LAST of the segy file')
+    parser.add_argument('--roi_samples', type=float, nargs=2, metavar=('FIRST', 'LAST'), required=False, help='Only load the time/depth samples from FIRST to LAST of the segy file')
+    parser.add_argument('--roi_step', type=int, nargs=3, metavar=('IL', 'XL', 'Z'), required=False, help='Only load every IL-th inline, XL-th crossline and Z-th sample of the region')
+    parser.add_argument('--export', metavar='OUT_DIR', required=False, help='Export slices into this directory without opening the interactive window')
+    parser.add_argument('--inlines', type=float, nargs=2, metavar=('FIRST', 'LAST'), required=False, help='Range of inline numbers to export inline slices of')
+    parser.add_argument('--crosslines', type=float, nargs=2, metavar=('FIRST', 'LAST'), required=False, help='Range of crossline numbers to export crossline slices of')
+    parser.add_argument('--depths', type=float, nargs=2, metavar=('FIRST', 'LAST'), required=False, help='Range of time/depth values to export depth slices of')
+    parser.add_argument('--step', type=int, default=1, help='Export every step-th line or sample within the ranges')
+    parser.add_argument('--export_format', default='png', choices=EXPORT_FORMATS, help='Export rendered images with horizon overlays or raw slices as .npy files')
+    parser.add_argument('--profile', action='store_true', help='Print the time spent in every stage of loading and updating the views, with percentiles of the update latency, and the peak memory on exit')
+    parser.add_argument('--cache_max_gb', type=float, required=False, help='Evict least recently used cache entries until the cache occupies at most this many GB')
 
     # Parse the command line arguments
     args = parser.parse_args()
+    if args.brick_size is not None and args.cache_dir is None:
+        parser.error('--brick_size requires -cache/--cache_dir to store the bricked volume')
+    if args.lazy and args.brick_size is not None:
+        parser.error('--lazy and --brick_size are alternative backends, only one of them can be selected')
+    if args.lazy and (args.dtype != 'float32' or args.cache_dir is not None or (args.workers or 1) > 1):
+        parser.error('--lazy cannot be combined with a --dtype other than float32, -cache/--cache_dir or --workers '
+                     'greater than 1')
+    if args.export is not None and args.inlines is None and args.crosslines is None and args.depths is None:
+        parser.error('--export requires at least one of --inlines, --crosslines and --depths')
+    if args.export is not None:
+        # options of the interactive viewer that batch exports do not support
+        viewer_options = (('--roi_inlines', args.roi_inlines, None), ('--roi_crosslines', args.roi_crosslines, None),
+                          ('--roi_samples', args.roi_samples, None), ('--roi_step', args.roi_step, None),
+                          ('--lazy', args.lazy, False), ('--brick_size', args.brick_size, None),
+                          ('--cache_max_gb', args.cache_max_gb, None), ('--attribute', args.attribute, 'amplitude'),
+                          ('--attribute_window', args.attribute_window, None),
+                          ('--attribute_cache_mb', args.attribute_cache_mb, None),
+                          ('--horizon_map', args.horizon_map, None), ('--horizon_window', args.horizon_window, 0),
+                          ('--horizon_statistic', args.horizon_statistic, 'mean'),
+                          ('--slice_cache_mb', args.slice_cache_mb, None), ('--prefetch', args.prefetch, None),
+                          ('--prefetch_mb', args.prefetch_mb, None))
+        unsupported = [option for option, value, default in viewer_options if value != default]
+        if unsupported:
+            parser.error('--export cannot be combined with {}'.format(', '.join(unsupported)))
 
     # extract values of the arguments
     path_segy = args.input_file  # path to segy file
 
+    # export slices in batch mode instead of opening the interactive window
+    if args.export is not None:
+        from utils.export import export_segy_slices
+        export_segy_slices(path_segy, args.export, inlines=args.inlines, crosslines=args.crosslines,
+                           depths=args.depths, step=args.step, fmt=args.export_format, horizon_path=args.horizon_path,
+                           cmap=args.color_map, clip_mode=args.clip_mode, cache_dir=args.cache_dir,
+                           rebuild_cache=args.rebuild_cache, dtype=args.dtype, workers=args.workers)
+        if args.profile:
+            from utils.profiling import get_profiler
+            print(get_profiler().format_summary())
+        return
+
     # construct keyword argument dictionary to handle optional arguments
     keyword_dict = {'horizon_file_path': args.horizon_path,
-                    'cmap': args.color_map}
+                    'cmap': args.color_map,
+                    'cache_dir': args.cache_dir,
+                    'rebuild_cache': args.rebuild_cache,
+                    'cache_max_bytes': None if args.cache_max_gb is None else int(args.cache_max_gb * 1024**3),
+                    'clip_mode': args.clip_mode,
+                    'dtype': args.dtype,
+                    'workers': args.workers,
+                    'lazy': args.lazy,
+                    'brick_size': args.brick_size,
+                    'slice_cache_bytes': None if args.slice_cache_mb is None else int(args.slice_cache_mb * 1024**2),
+                    'attribute': args.attribute,
+                    'attribute_window': args.attribute_window,
+                    'attribute_cache_bytes': None if args.attribute_cache_mb is None else int(args.attribute_cache_mb * 1024**2),
+                    'horizon_map': args.horizon_map,
+                    'horizon_window': args.horizon_window,
+                    'horizon_statistic': args.horizon_statistic,
+                    'iline_range': args.roi_inlines,
+                    'xline_range': args.roi_crosslines,
+                    'sample_range': args.roi_samples,
+                    'steps': args.roi_step,
+                    'prefetch': args.prefetch,
+                    'prefetch_bytes': None if args.prefetch_mb is None else int(args.prefetch_mb * 1024**2)}
 
-    # initialize seismic slicer with the user-supplied arguments
+    # initialize seismic slicer with the user-supplied arguments, the gui toolkit is only loaded when it is needed
+    from seismic_slicer import SeismicSlicer
     seismic_slicer = SeismicSlicer(path_segy=path_segy, **keyword_dict)
 
+    # report where the time went once the window is closed
+    if args.profile:
+        from utils.profiling import get_profiler
+        print(get_profiler().format_summary())
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,7 +1,95 @@
-from IPython.display import display, clear_output
+import numpy as np
+import matplotlib.pyplot as plt
 from utils.loading import segy2npy
+from utils.stats import clip_limits
+from utils.profiling import timed, stage
+from utils.horizons import HorizonPickIndex, load_horizon, load_horizons
+from utils.cache import load_cached_cube, load_cached_bricks, evict_cache, cache_key
+from utils.surfaces import HorizonSurface, extract_horizon_map
+from utils.attributes import AttributeVolume, attribute_stats, ATTRIBUTES, ATTRIBUTE_LABELS, ATTRIBUTE_CACHE_BYTES, \
+    RMS_WINDOW
+from utils.pyramid import build_pyramid, select_level, level_extent
+from utils.volume import LazySegyVolume, SliceVolume, SlicePrefetcher, SLICE_CACHE_BYTES, PREFETCH_SLICES, \
+    PREFETCH_BYTES
 from utils.visualization import *
 from pathlib import Path
+from matplotlib.backend_bases import FigureCanvasBase
+from matplotlib.patches import Rectangle
+from matplotlib.transforms import Bbox, IdentityTransform
+
+
+@timed('load.total')
+def load_seismic(path_segy, **kwargs):
+    """function loads the seismic volume in the segy file through the backend selected by the keyword arguments:
+    a bricked copy in the cache directory if brick_size is given, on-demand trace reads if lazy is True, a
+    memory-mapped cube in the cache directory if cache_dir is given, or an in-memory cube otherwise. Cubes and bricks
+    are stored as the data type given by dtype. Cubes come with a pyramid of coarser levels for display. In-memory
+    cubes may be restricted to a region of interest by iline_range, xline_range, sample_range and decimation steps
+
+    Returns
+    -------
+    seismic: array or SliceVolume
+        3D volume of the form inlines x crosslines x samples
+    ilines: array
+        array of sorted unique inline numbers in the segy file
+    xlines: array
+        array of sorted unique xline numbers in the segy file
+    samples: array
+        array of time/depth samples in segy file
+    stats: dict
+        mean, std, min, max and histogram of the values stored in the volume, together with the quantization scale
+        converting stored values into amplitudes
+    levels: list of array
+        pyramid levels 1, 2, ... of the volume, each half the size of the previous one along every axis. Empty for
+        lazy and bricked volumes, which are only shown at full resolution
+    """
+
+    cache_dir = kwargs.get('cache_dir')
+    dtype = kwargs.get('dtype') or 'float32'
+    slice_cache_bytes = kwargs.get('slice_cache_bytes') or SLICE_CACHE_BYTES
+    cache_layout = None
+    levels = []
+    region = {name: kwargs[name] for name in ('iline_range', 'xline_range', 'sample_range', 'steps')
+              if kwargs.get(name) is not None}
+    if region and (kwargs.get('brick_size') is not None or kwargs.get('lazy', False) or cache_dir is not None):
+        raise ValueError('a region of interest can only be loaded into memory, not with bricks, lazy reads or a cache')
+    if kwargs.get('lazy', False) and kwargs.get('brick_size') is not None:
+        raise ValueError('lazy reads and bricks are alternative backends, only one of them can be selected')
+    if kwargs.get('lazy', False) and (dtype != 'float32' or cache_dir is not None or (kwargs.get('workers') or 1) > 1):
+        raise ValueError('lazy reads return the float32 samples of the segy file as they are, they cannot be combined '
+                         'with another data type, a cache or several ingest workers')
+
+    if kwargs.get('brick_size') is not None:
+        # read slices from a bricked copy of the volume kept in the cache directory
+        if cache_dir is None:
+            raise ValueError('a cache directory is required to store the bricked volume')
+        seismic = load_cached_bricks(path_segy, cache_dir, kwargs['brick_size'],
+                                     rebuild=kwargs.get('rebuild_cache', False), cache_bytes=slice_cache_bytes,
+                                     dtype=dtype)
+        ilines, xlines, samples = seismic.ilines, seismic.xlines, seismic.samples
+        stats = seismic.stats
+        cache_layout = 'bricks{}-{}'.format(kwargs['brick_size'], dtype)
+    elif kwargs.get('lazy', False):
+        # read traces on demand instead of loading the whole volume into memory
+        seismic = LazySegyVolume(path_segy, cache_bytes=slice_cache_bytes)
+        ilines, xlines, samples = seismic.ilines, seismic.xlines, seismic.samples
+        stats = dict(seismic.estimate_stats(), scale=1.0)  # estimated from a random trace subsample
+    elif cache_dir is not None:
+        seismic, ilines, xlines, samples, stats, levels = load_cached_cube(path_segy, cache_dir,
+                                                                           rebuild=kwargs.get('rebuild_cache', False),
+                                                                           workers=kwargs.get('workers') or 1,
+                                                                           dtype=dtype, return_pyramid=True)
+        cache_layout = 'cube-{}'.format(dtype)
+    else:
+        seismic, ilines, xlines, samples, stats = segy2npy(path_segy, workers=kwargs.get('workers') or 1, dtype=dtype,
+                                                           return_stats=True, **region)
+        levels = build_pyramid(seismic)
+
+    # trim cache to its size budget, never evicting the entry just loaded
+    if cache_layout is not None and kwargs.get('cache_max_bytes') is not None:
+        evict_cache(cache_dir, kwargs['cache_max_bytes'], keep=(cache_key(path_segy, cache_layout),))
+
+    return seismic, ilines, xlines, samples, stats, levels
 
 
 # Class definition for seismic slice visualizer
@@ -10,13 +98,14 @@ class SeismicSlicer():
         """initializes class object by storing path to segy file"""
 
         # read segy file and extract seismic and other survey parameters
-        seismic, ilines, xlines, samples = segy2npy(path_segy)
+        seismic, ilines, xlines, samples, stats, levels = load_seismic(path_segy, **kwargs)
 
         self.seismic = seismic
+        self.amplitude_levels = [seismic] + levels  # display pyramid, full resolution first
+        self.amplitude_stats = stats
         self.ilines = np.sort(ilines)
         self.xlines = np.sort(xlines)
         self.samples = np.sort(samples)
-        self.std = seismic.std()
         self.horizon_flag = False  # Only visualize seismic
 
         # also plot horizon is horizon path provided
@@ -24,30 +113,74 @@ class SeismicSlicer():
             self.horizon_flag = True
             self.horizon_file_path = kwargs['horizon_file_path']
 
+        # number of processes used to parse horizon files, defaults to the number of CPUs
+        self.workers = kwargs.get('workers')
+
         # Use user-specified cmap if provided
         if kwargs['cmap'] is not None:
             self.cmap = kwargs['cmap']
         else:
             self.cmap = 'gray'  # use grayscale colormap otherwise
 
+        # clip in multiples of the standard deviation or at amplitude percentiles looked up in the histogram
+        self.clip_mode = kwargs.get('clip_mode') or 'std'
+
+        # load slices ahead of the sliders in the background when slices are read from disk or computed on demand
+        self.prefetcher = None
+        self.n_prefetch = kwargs.get('prefetch')
+        self.n_prefetch = PREFETCH_SLICES if self.n_prefetch is None else self.n_prefetch
+        self.prefetch_bytes = kwargs.get('prefetch_bytes') or PREFETCH_BYTES
+
+        # show the amplitudes along a horizon in the depth view, the depth slider shifting it up and down, instead of
+        # depth slices. horizon_map is the file name of the horizon, or True for the first one
+        self.horizon_map = kwargs.get('horizon_map')
+        self.horizon_window = kwargs.get('horizon_window') or 0
+        self.horizon_statistic = kwargs.get('horizon_statistic') or 'mean'
+        self.map_surface = None
+        if self.horizon_map and not self.horizon_flag:
+            raise ValueError('a horizon file is required to show a horizon map')
+
+        # push every frame to the notebook output, or let the figure canvas redraw itself when run as a script
+        self.render_mode = kwargs.get('render_mode') or detect_render_mode()
+
         # initialize initial frame values along all three directions
         self.current_frame_1 = 0
         self.current_frame_2 = 0
         self.current_frame_3 = 0
-        self.clip_factor = 3
+        self.clip_factor = 99 if self.clip_mode == 'percentile' else 3
+
+        # show a seismic attribute instead of the amplitudes, computed only for the slices on display
+        self.attribute_window = kwargs.get('attribute_window') or RMS_WINDOW
+        self.attribute_cache_bytes = kwargs.get('attribute_cache_bytes') or ATTRIBUTE_CACHE_BYTES
+        self.select_attribute(kwargs.get('attribute') or 'amplitude')
         
         # initialize gui and draw initial views
         self.initialize_slicer()
 
+        # prepare redrawing only the changed parts of the figure on slider events
+        self.init_incremental_redraw()
+
+        # show pyramid levels matching the size of the axes on screen and the zoom
+        self.init_pyramid_display()
+        self.fig.canvas.mpl_connect('close_event', self.close_prefetcher)
+
+        # cycle through the seismic attributes with the n key
+        self.fig.canvas.mpl_connect('key_press_event', self.on_key)
+
         # Attach the update function to the sliders' on_changed events
         self.frame_slider1.on_changed(self.update)
         self.frame_slider2.on_changed(self.update)
         self.frame_slider3.on_changed(self.update)
         self.clip_slider.on_changed(self.update)
 
-        # show figure
-        plt.show()
+        # show figure, in a notebook with a static backend through a display handle that every update replaces
+        if self.render_mode == 'notebook':
+            self.display_handle = show_in_notebook(self.fig)
+            plt.close(self.fig)  # the handle shows the figure, keep the backend from showing it a second time
+        else:
+            plt.show()
      
+    @timed('slicer.init')
     def initialize_slicer(self):
         
         # Create initial figure
@@ -58,18 +191,32 @@ class SeismicSlicer():
         img1 = self.init_section_view(ax[0])
 
         # initialize horizon plot
+        self.horizon_layers = []  # (indexed picks, line2D artist) pairs of every horizon
         if self.horizon_flag:
             if Path(self.horizon_file_path).is_file():  # check if path is a single file or a directory of horizons
-                self.picks = self.save_picks(self.horizon_file_path)
+                picks = self.save_picks(self.horizon_file_path)
+                self.rasterize_horizon(picks, Path(self.horizon_file_path).name)
+                self.picks = self.index_picks(picks)
                 self.horizon_plot = self.plot_horizon(img1, self.picks, Path(self.horizon_file_path).name)
+                self.horizon_layers.append((self.picks, self.horizon_plot))
             else:
                 self.horizon_file_paths = list_files_in_directory(self.horizon_file_path)
                 self.horizon_plots = []  # list to store matplotlib line2D artists for every horizon
-                self.picks_all_hrzs = []  # class variable to store picks for all files
-                for file in self.horizon_file_paths:
-                    picks = self.save_picks(file)
+                self.picks_all_hrzs = []  # class variable to store indexed picks for all files
+
+                # parse all horizon files concurrently
+                for file, picks in zip(self.horizon_file_paths, load_horizons(self.horizon_file_paths, self.workers)):
+                    self.rasterize_horizon(picks, Path(file).name)
+                    picks = self.index_picks(picks)
                     self.horizon_plots.append(self.plot_horizon(img1, picks, Path(file).name))
                     self.picks_all_hrzs.append(picks)
+                self.horizon_layers.extend(zip(self.picks_all_hrzs, self.horizon_plots))
+
+            # show legend
+            img1.axes.legend()
+
+            if self.horizon_map and self.map_surface is None:
+                raise ValueError('no horizon file named {} in {}'.format(self.horizon_map, self.horizon_file_path))
 
         # initialize depth view
         img2 = self.init_depth_view(ax[1])
@@ -86,7 +233,7 @@ class SeismicSlicer():
         frame_slider1, frame_slider2, frame_slider3 = create_section_sliders(nil, nxl, nz, init_vals)
 
         # create slider to apply clipping to seismic views
-        clip_slider = create_clip_slider()
+        clip_slider = create_clip_slider(self.clip_mode)
 
         self.fig = fig
         self.img1 = img1
@@ -100,76 +247,360 @@ class SeismicSlicer():
         self.frame_slider3 = frame_slider3
         self.clip_slider = clip_slider
 
+    @timed('update.total')
     def update(self, val):
-        """update views based off user input to sliders"""
+        """update views based off user input to sliders. Only the data of views whose slider positions changed is
+        recomputed, and only the axes affected by the change are redrawn"""
 
         # retrieve current values from sliders
-        self.current_frame_1 = int(self.frame_slider1.val)
-        self.current_frame_2 = int(self.frame_slider2.val)
-        self.current_frame_3 = int(self.frame_slider3.val)
-        self.clip_factor = int(self.clip_slider.val)
-
-        # update inline/crossline view
-        self.img1.set_array(plot_section_slices(self.seismic, self.current_frame_1, self.current_frame_2))
-
-        # update horizon plot by extracting x/y picks to plot on section view
-        if self.horizon_flag:
-            if Path(self.horizon_file_path).is_file():  # if only one horizon file
-                self.update_horizon_plot(self.picks, self.horizon_plot)
-            else: # if multiple files
-                for picks, artist in zip(self.picks_all_hrzs, self.horizon_plots):
+        frame_1 = int(self.frame_slider1.val)
+        frame_2 = int(self.frame_slider2.val)
+        frame_3 = int(self.frame_slider3.val)
+        clip_factor = float(self.clip_slider.val) if self.clip_mode == 'percentile' else int(self.clip_slider.val)
+
+        # find out which state changed since the last update
+        inline_changed = frame_1 != self.current_frame_1
+        xline_changed = frame_2 != self.current_frame_2
+        section_changed = inline_changed or xline_changed
+        depth_changed = frame_3 != self.current_frame_3
+        clip_changed = clip_factor != self.clip_factor
+
+        self.current_frame_1 = frame_1
+        self.current_frame_2 = frame_2
+        self.current_frame_3 = frame_3
+        self.clip_factor = clip_factor
+
+        if section_changed:
+            # update inline/crossline view
+            with stage('update.section'):
+                self.img1.set_array(self.section_image())
+
+            # update horizon plot by extracting x/y picks to plot on section view
+            with stage('update.horizons'):
+                for picks, artist in self.horizon_layers:
                     self.update_horizon_plot(picks, artist)
 
-        # update marker positions on inline/crossline view
-        self.crossline_marker[0].set_ydata([self.samples[self.current_frame_3], self.samples[self.current_frame_3]])
-        self.depth_marker[0].set_xdata([self.current_frame_2, self.current_frame_2])
-
-        # update depth slice view
-        self.img2.set_array(plot_depth_slice(self.seismic, self.current_frame_3))
-
-        # update inline and crossline markers on depth view
-        self.inline_marker[0].set_ydata([self.ilines[self.current_frame_1], self.ilines[self.current_frame_1]])
-        self.crossline_marker_depth[0].set_xdata([self.xlines[self.current_frame_2], self.xlines[self.current_frame_2]])
+            # update crossline marker on inline/crossline view and inline and crossline markers on depth view
+            self.update_section_markers()
+
+        if depth_changed:
+            # update depth marker position on inline/crossline view
+            self.update_depth_marker()
+
+            # update depth slice view
+            with stage('update.depth'):
+                self.img2.set_array(self.depth_image())
+
+        # load the next slices in the direction the sliders moved while the current ones are drawn
+        if self.prefetcher is not None:
+            if inline_changed:
+                self.prefetcher.observe('il', self.current_frame_1)
+            if xline_changed:
+                self.prefetcher.observe('xl', self.current_frame_2)
+            # a horizon map is gathered along the horizon, not from the depth slices that would be read ahead
+            if depth_changed and self.map_surface is None:
+                self.prefetcher.observe('z', self.current_frame_3)
+
+        if clip_changed:
+            # apply clipping to image views
+            vmin, vmax = self.clip_limits()
+            self.img1.set_clim(vmin=vmin, vmax=vmax)
+            self.img2.set_clim(vmin=vmin, vmax=vmax)
+
+        # every change moves a marker or changes the colors on both views
+        if not (section_changed or depth_changed or clip_changed):
+            return
+
+        if self.render_mode == 'notebook':
+            # replace the previous frame in the notebook output, there is none to replace outside of a notebook
+            with stage('update.display'):
+                if self.display_handle is not None:
+                    self.display_handle.update(self.fig)
+        else:
+            self.redraw([self.img1.axes, self.img2.axes])
 
-        # show legend
-        self.img1.axes.legend()
+    def select_attribute(self, attribute):
+        """function selects the seismic attribute shown in the views. Every pyramid level is wrapped in an attribute
+        volume that only computes the slices requested from it, so selecting an attribute costs the computation of the
+        slices on display instead of a pass over the whole volume. The color scale is derived from these slices"""
 
-        # apply clipping to image views
-        self.img1.set_clim(vmin=-self.clip_factor*self.std, vmax=self.clip_factor*self.std)
-        self.img2.set_clim(vmin=-self.clip_factor * self.std, vmax=self.clip_factor * self.std)
+        if attribute == 'amplitude':
+            self.levels = self.amplitude_levels
+            self.stats = self.amplitude_stats
+        else:
+            cache_bytes = self.attribute_cache_bytes // len(self.amplitude_levels)
+            self.levels = [AttributeVolume(level, attribute, self.attribute_window // 2 ** k, cache_bytes)
+                           for k, level in enumerate(self.amplitude_levels)]
+            volume = self.levels[0]
+            self.stats = attribute_stats([volume[self.current_frame_1], volume[:, self.current_frame_2],
+                                          volume[:, :, self.current_frame_3]], attribute, self.amplitude_stats['scale'])
+
+        self.attribute = attribute
+        self.std = self.stats['std']  # in units of the stored values, so clipping works on quantized cubes unchanged
+        self.scale = self.stats['scale']  # amplitude represented by one unit of the stored values
+
+        # the prefetcher fills the slice cache of the volume on display
+        self.close_prefetcher()
+        if isinstance(self.levels[0], SliceVolume) and self.n_prefetch > 0:
+            self.prefetcher = SlicePrefetcher(self.levels[0], self.n_prefetch, self.prefetch_bytes)
+
+    def switch_attribute(self, attribute):
+        """function shows the given seismic attribute in both views, keeping the slider positions"""
+        self.select_attribute(attribute)
+
+        # stitched section buffers refer to the previous volumes
+        self.sections = {}
+        self.img1.set_data(self.section_image())
+        self.img2.set_data(self.depth_image())
+        vmin, vmax = self.clip_limits()
+        self.img1.set_clim(vmin=vmin, vmax=vmax)
+        self.img2.set_clim(vmin=vmin, vmax=vmax)
+        self.img1.axes.set_title(self.section_title())
+
+        # titles changed as well, redraw the full figure
+        if self.render_mode == 'notebook':
+            if self.display_handle is not None:
+                self.display_handle.update(self.fig)
+        elif not self.headless:
+            self.fig.canvas.draw_idle()
+
+    def on_key(self, event):
+        """function switches to the next seismic attribute when the n key is pressed"""
+        if event.key == 'n':
+            self.switch_attribute(ATTRIBUTES[(ATTRIBUTES.index(self.attribute) + 1) % len(ATTRIBUTES)])
+
+    def close_prefetcher(self, event=None):
+        """function stops loading slices in the background"""
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+
+    def init_incremental_redraw(self):
+        """function prepares redrawing only the axes changed by a slider event and blitting them onto the canvas,
+        instead of redrawing the full figure. Blitting is only used on canvases that implement it, e.g. GUI windows,
+        other canvases fall back to redrawing the full figure"""
+
+        canvas = self.fig.canvas
+        self.sliders = [self.frame_slider1, self.frame_slider2, self.frame_slider3, self.clip_slider]
+        self.blit = type(canvas).blit is not FigureCanvasBase.blit
+        self.canvas_drawn = False  # artists can only be drawn individually after a first full draw
+
+        # canvases without an event loop, e.g. Agg, draw synchronously when asked for an idle draw. Nothing shows
+        # their frames, so they are only drawn when the figure is saved or displayed
+        self.headless = type(canvas).draw_idle is FigureCanvasBase.draw_idle
+
+        # an idle draw only schedules the full draw of the figure, which the event loop runs later, so the full draw
+        # itself is timed wherever it runs
+        self.fig.draw = timed('update.draw')(self.fig.draw)
+
+        # artists to redraw on every axes, in drawing order
+        self.axes_artists = {self.img1.axes: [self.img1, self.crossline_marker[0], self.depth_marker[0]] +
+                                             [artist[0] for _, artist in self.horizon_layers],
+                             self.img2.axes: [self.img2, self.inline_marker[0], self.crossline_marker_depth[0]]}
+        if self.img1.axes.get_legend() is not None:
+            self.axes_artists[self.img1.axes].append(self.img1.axes.get_legend())
+
+        if self.blit or self.headless:
+            # sliders are redrawn together with the views instead of triggering a full redraw themselves
+            for slider in self.sliders:
+                slider.drawon = False
+            canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        """function records that the canvas has been fully drawn, e.g. initially or after zooming or resizing"""
+        self.canvas_drawn = True
+
+    def redraw(self, axes):
+        """function redraws the given axes and the sliders and blits them onto the canvas, falling back to a full
+        redraw of the figure when blitting is not possible"""
+
+        canvas = self.fig.canvas
+        if self.headless:
+            return
+        if not (self.blit and self.canvas_drawn):
+            # the full draw is timed as update.draw when the event loop runs it
+            canvas.draw_idle()
+            return
+
+        with stage('update.redraw'):
+            for ax in axes:
+                # repaint axes background, its changed artists and its frame, then copy the axes area to the screen
+                ax.draw_artist(ax.patch)
+                for artist in self.axes_artists[ax]:
+                    ax.draw_artist(artist)
+                for spine in ax.spines.values():
+                    ax.draw_artist(spine)
+                canvas.blit(ax.bbox)
+
+            self.redraw_sliders()
+            canvas.flush_events()
+
+    def redraw_sliders(self):
+        """function redraws the band of the figure holding the sliders, including their labels and value texts"""
+
+        canvas = self.fig.canvas
+        renderer = canvas.get_renderer()
+
+        # band spanning the figure width and all slider axes, labels and value texts
+        extent = Bbox.union([slider.ax.get_tightbbox(renderer) for slider in self.sliders])
+        band = Bbox.from_extents(self.fig.bbox.x0, extent.y0 - 2, self.fig.bbox.x1, extent.y1 + 2)
+
+        # erase previous slider state with the figure background color and draw the sliders on top
+        eraser = Rectangle((band.x0, band.y0), band.width, band.height, transform=IdentityTransform(),
+                           facecolor=self.fig.get_facecolor(), edgecolor='none')
+        eraser.set_figure(self.fig)
+        self.fig.draw_artist(eraser)
+        for slider in self.sliders:
+            self.fig.draw_artist(slider.ax)
+
+        canvas.blit(band)
+
+    def section_image(self):
+        """function returns the stitched inline/crossline section at the current slider positions, taken from the
+        pyramid level currently shown in the section view"""
+        factor = 2 ** self.section_level
+        if self.section_level not in self.sections:
+            self.sections[self.section_level] = StitchedSection(self.levels[self.section_level],
+                                                                self.current_frame_1 // factor,
+                                                                self.current_frame_2 // factor)
+        return self.sections[self.section_level].update(self.current_frame_1 // factor, self.current_frame_2 // factor)
+
+    def depth_image(self):
+        """function returns the depth slice at the current slider position, taken from the pyramid level currently
+        shown in the depth view. In horizon map mode it returns the horizon-flattened slice instead, i.e. the
+        amplitudes along the horizon shifted by the distance of the slider from the median depth of the horizon"""
+        factor = 2 ** self.depth_level
+        if self.map_surface is None:
+            return plot_depth_slice(self.levels[self.depth_level], self.current_frame_3 // factor)
+
+        positions, mask = self.map_surface.at_level(factor)
+        offset = (self.current_frame_3 - self.map_surface.reference_position()) / factor
+        return extract_horizon_map(self.levels[self.depth_level], positions, mask, offset,
+                                   self.horizon_window // factor, self.horizon_statistic)
+
+    def init_pyramid_display(self):
+        """function selects the initial pyramid levels of both views and re-selects them whenever the views are zoomed,
+        panned or resized"""
+
+        if len(self.levels) == 1:
+            return
+
+        # image extents change with the level, keep the axes limits where the user put them
+        for ax in (self.img1.axes, self.img2.axes):
+            ax.set_autoscale_on(False)
+            ax.callbacks.connect('xlim_changed', self.select_levels)
+            ax.callbacks.connect('ylim_changed', self.select_levels)
+        self.fig.canvas.mpl_connect('resize_event', self.select_levels)
+
+        self.select_levels()
+
+    def view_level(self, ax, extent, full_shape):
+        """function returns the pyramid level showing about one data pixel per screen pixel inside the current limits
+        of the axes, where extent and full_shape are the extent and shape of the full resolution image"""
+        left, right, bottom, top = extent
+        x0, x1 = ax.get_xlim()
+        y0, y1 = ax.get_ylim()
+        visible_cols = full_shape[1] * min(abs(x1 - x0) / (abs(right - left) or 1), 1)
+        visible_rows = full_shape[0] * min(abs(y1 - y0) / (abs(bottom - top) or 1), 1)
+        return select_level(len(self.levels), visible_rows, visible_cols, ax.bbox.height, ax.bbox.width)
+
+    def select_levels(self, *args):
+        """function switches each view to the pyramid level matching its current size on screen and zoom"""
 
-        self.fig.canvas.draw_idle()
-        clear_output(wait=True)
-        display(self.fig)
+        nil, nxl, nz = self.seismic.shape
+        section_level = self.view_level(self.img1.axes, self.section_extent, (nz, nil + nxl))
+        depth_level = self.view_level(self.img2.axes, self.depth_extent, (nil, nxl))
+
+        if section_level != self.section_level:
+            self.section_level = section_level
+            image = self.section_image()
+            self.img1.set_data(image)
+            self.img1.set_extent(level_extent(self.section_extent, (nz, nil + nxl), image.shape, 2 ** section_level))
+
+            # the section on display moved onto the grid of the new level, and so do its overlays
+            for picks, artist in self.horizon_layers:
+                self.update_horizon_plot(picks, artist)
+            self.update_section_markers()
+
+        if depth_level != self.depth_level:
+            self.depth_level = depth_level
+            image = self.depth_image()
+            self.img2.set_data(image)
+            self.img2.set_extent(level_extent(self.depth_extent, (nil, nxl), image.shape, 2 ** depth_level))
+            self.update_depth_marker()
+
+    def displayed_section_frames(self):
+        """function returns the inline and crossline positions of the section on display, i.e. the slider positions
+        snapped onto the grid of the pyramid level shown in the section view, so that the markers and horizon overlays
+        line up with the image"""
+        factor = 2 ** self.section_level
+        return self.current_frame_1 // factor * factor, self.current_frame_2 // factor * factor
+
+    def displayed_depth_frame(self):
+        """function returns the position of the depth slice on display, i.e. the slider position snapped onto the
+        grid of the pyramid level shown in the depth view. Horizon maps are shifted by fractions of a level sample and
+        are shown at the slider position"""
+        if self.map_surface is not None:
+            return self.current_frame_3
+        factor = 2 ** self.depth_level
+        return self.current_frame_3 // factor * factor
+
+    def update_section_markers(self):
+        """function moves the crossline marker on the section view and the inline and crossline markers on the depth
+        view onto the section on display"""
+        frame_1, frame_2 = self.displayed_section_frames()
+        self.depth_marker[0].set_xdata([frame_2, frame_2])
+        self.inline_marker[0].set_ydata([self.ilines[frame_1], self.ilines[frame_1]])
+        self.crossline_marker_depth[0].set_xdata([self.xlines[frame_2], self.xlines[frame_2]])
+
+    def update_depth_marker(self):
+        """function moves the depth marker on the section view onto the depth slice on display"""
+        frame_3 = self.displayed_depth_frame()
+        self.crossline_marker[0].set_ydata([self.samples[frame_3], self.samples[frame_3]])
+
+    def clip_limits(self):
+        """function returns the color limits of the image views for the current clip slider value"""
+        return clip_limits(self.stats, self.clip_mode, self.clip_factor)
 
     def init_section_view(self, ax):
         """function creates and populates an artist to show an image consisting
          of the stitched inline and crossline views through the volume"""
 
         # create inline/crossline view and set title
-        img = ax.imshow(plot_section_slices(self.seismic, self.current_frame_1, self.current_frame_2),
-                            extent=(0, self.seismic.shape[0]+self.seismic.shape[1], self.samples.max(), self.samples.min()),
-                            cmap=self.cmap, vmin=-self.clip_factor*self.std, vmax=self.clip_factor*self.std, aspect='auto')
+        vmin, vmax = self.clip_limits()
+        self.section_level = 0
+        self.sections = {}  # stitched section buffer of every pyramid level shown so far
+        self.section_extent = (0, self.seismic.shape[0]+self.seismic.shape[1], self.samples.max(), self.samples.min())
+        img = ax.imshow(self.section_image(), extent=self.section_extent,
+                            cmap=self.cmap, vmin=vmin, vmax=vmax, aspect='auto')
 
         ax.set_xticks([])
         ax.set_ylabel('Depth')
         ax.set_xlabel('Sample Position Laterally')
-        img.axes.set_title('Inline\Crossline View')
+        img.axes.set_title(self.section_title())
 
         return img
 
+    def section_title(self):
+        """function returns the title of the section view naming the attribute shown"""
+        if self.attribute == 'amplitude':
+            return 'Inline\\Crossline View'
+        return 'Inline\\Crossline View: {}'.format(ATTRIBUTE_LABELS[self.attribute])
+
     def init_depth_view(self, ax):
         """function creates and populates an artist to show an image consisting
          of the depth view through the volume"""
 
         # create depth slice view and set title
-        img = ax.imshow(plot_depth_slice(self.seismic, self.current_frame_3),
-                            extent=(self.xlines.min(), self.xlines.max(), self.ilines.max(), self.ilines.min()),
-                            cmap=self.cmap, vmin=-3*self.std, vmax=3*self.std, aspect='auto')
+        vmin, vmax = self.clip_limits()
+        self.depth_level = 0
+        self.depth_extent = (self.xlines.min(), self.xlines.max(), self.ilines.max(), self.ilines.min())
+        img = ax.imshow(self.depth_image(), extent=self.depth_extent,
+                            cmap=self.cmap, vmin=vmin, vmax=vmax, aspect='auto')
 
         ax.set_xlabel('Crossline Numbers')
         ax.set_ylabel('Inline Numbers')
-        img.axes.set_title('Depth View')
+        img.axes.set_title('Depth View' if self.map_surface is None else 'Horizon View: {}'.format(self.map_name))
 
         return img
 
@@ -215,33 +646,29 @@ class SeismicSlicer():
 
     def save_picks(self, horizon_file_path):
         """function extracts columns from horizon text files and saves them as class variables to
-        later be used for plotting picks"""
-
-        # read horion picks file
-        horizon_file = np.genfromtxt(horizon_file_path)
+        later be used for plotting picks. Parsed picks are cached in a binary sidecar file next to the horizon file"""
+        return load_horizon(horizon_file_path)
 
-        # picks object to store columns
-        picks = []
+    def rasterize_horizon(self, picks, filename):
+        """function rasterizes the picks onto the survey grid if filename is the horizon to show in the depth view,
+        and moves the depth slider onto the median depth of the horizon"""
+        if self.map_surface is not None or self.horizon_map not in (True, filename):
+            return
 
-        # extract horizon picks
-        picks.append(horizon_file[1:, 0].astype(int))
-        picks.append(horizon_file[1:, 1].astype(int))
-        picks.append(horizon_file[1:, 2].astype(int))
+        self.map_surface = HorizonSurface(self.ilines, self.xlines, self.samples, picks[0], picks[1], picks[2])
+        self.map_name = filename
+        self.current_frame_3 = self.map_surface.reference_position()
 
-        return picks
+    def index_picks(self, picks):
+        """function digitizes horizon picks onto the survey grid once and groups them by inline and crossline, so
+        that the picks on the current sections can be looked up on every update without touching the full horizon"""
+        return HorizonPickIndex(self.ilines, self.xlines, self.samples, picks[0], picks[1], picks[2])
 
     def plot_horizon(self, img, picks, filename):
         """plot horizon on section view on img object"""
 
-        # extract horizon picks
-        inline_picks = picks[0]
-        xline_picks = picks[1]
-        z_picks = picks[2]
-
         # extract x/y picks to plot on section view
-        x_coords, y_coords = extract_section_picks(np.sort(self.ilines), np.sort(self.xlines), np.sort(self.samples),
-                                                   inline_picks, xline_picks, z_picks, self.current_frame_1,
-                                                   self.current_frame_2)
+        x_coords, y_coords = picks.section_picks(*self.displayed_section_frames())
 
         # plot on img artist
         horizon_plot = img.axes.plot(x_coords, y_coords, label=filename)
@@ -251,15 +678,8 @@ class SeismicSlicer():
     def update_horizon_plot(self, picks, horizon_artist):
         """function updates horizon plot based on current inline/xline information"""
 
-        # extract horizon picks
-        inline_picks = picks[0]
-        xline_picks = picks[1]
-        z_picks = picks[2]
-
-        # extract x/y picks to plot on section view
-        x_coords, y_coords = extract_section_picks(np.sort(self.ilines), np.sort(self.xlines), np.sort(self.samples),
-                                                   inline_picks, xline_picks, z_picks, self.current_frame_1,
-                                                   self.current_frame_2)
+        # extract x/y picks to plot on section view, at the section on display
+        x_coords, y_coords = picks.section_picks(*self.displayed_section_frames())
 
         # update the horizon artist
         horizon_artist[0].set_xdata(x_coords)
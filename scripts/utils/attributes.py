@@ -0,0 +1,189 @@
+# Script contains seismic attributes computed slice by slice from the volume on display. An attribute volume wraps the
+# amplitude volume and only computes the attribute of the inline, crossline and depth slices that are requested,
+# keeping them in a bounded LRU cache, so that no attribute cube is ever built in memory
+
+import numpy as np
+from utils.stats import StreamingStats
+from utils.volume import SliceVolume
+from utils.constants import ATTRIBUTES
+from utils.profiling import timed
+
+# labels of the attributes that can be shown, see ATTRIBUTES
+ATTRIBUTE_LABELS = {'amplitude': 'Amplitude', 'envelope': 'Envelope', 'phase': 'Instantaneous Phase',
+                    'rms': 'RMS Amplitude'}
+
+# default memory budget in bytes of the cache of computed attribute slices
+ATTRIBUTE_CACHE_BYTES = 256 * 1024**2
+
+# default length in samples of the sliding window the RMS amplitude is computed over
+RMS_WINDOW = 9
+
+# number of samples above and below a depth slice the analytic signal is computed over, as a depth slice has no
+# complete traces to transform
+HILBERT_HALO = 32
+
+# memory budget in bytes of the block of samples, as complex spectra, an attribute sub-volume is computed from at a
+# time
+ATTRIBUTE_CHUNK_BYTES = 64 * 1024**2
+
+
+def analytic_signal(traces):
+    """function returns the analytic signal of traces along their last axis, computed with the FFT like
+    scipy.signal.hilbert"""
+    n = traces.shape[-1]
+
+    # one-sided spectrum of the real traces, doubling the positive frequencies but not the zero and Nyquist ones. The
+    # inverse transform pads it with zeros for the negative frequencies
+    spectrum = np.fft.rfft(traces, axis=-1)
+    spectrum[..., 1:(n + 1) // 2] *= 2
+    return np.fft.ifft(spectrum, n=n, axis=-1)
+
+
+def rms_amplitude(traces, window=RMS_WINDOW):
+    """function returns the RMS amplitude of traces in a sliding window of window samples centered on every sample
+    along their last axis. The window is shortened at the ends of the traces"""
+    half = window // 2
+    squares = np.square(traces, dtype=np.float64)
+    cumulative = np.concatenate((np.zeros(squares.shape[:-1] + (1,)), np.cumsum(squares, axis=-1)), axis=-1)
+
+    n = traces.shape[-1]
+    stops = np.minimum(np.arange(n) + half + 1, n)
+    starts = np.maximum(np.arange(n) - half, 0)
+    return np.sqrt((cumulative[..., stops] - cumulative[..., starts]) / (stops - starts))
+
+
+def compute_attribute(traces, attribute, window=RMS_WINDOW):
+    """function computes an attribute of traces along their last axis, vectorized over all other axes
+
+    Parameters
+    ----------
+    traces: array
+        array of traces with samples along the last axis, e.g. an inline or crossline slice
+    attribute: str
+        one of ATTRIBUTES: 'amplitude', the envelope or instantaneous phase in radians of the analytic signal, or the
+        RMS amplitude in a sliding window
+    window: int
+        length in samples of the sliding window of the RMS amplitude
+
+    Returns
+    -------
+    values: array
+        float32 array of the shape of traces
+    """
+
+    traces = np.asarray(traces, dtype=np.float32)
+    if attribute == 'envelope':
+        return np.abs(analytic_signal(traces)).astype(np.float32)
+    if attribute == 'phase':
+        return np.angle(analytic_signal(traces)).astype(np.float32)
+    if attribute == 'rms':
+        return rms_amplitude(traces, window).astype(np.float32)
+    if attribute == 'amplitude':
+        return traces
+
+    raise ValueError('attribute must be one of {}, got {}'.format(ATTRIBUTES, attribute))
+
+
+class AttributeVolume(SliceVolume):
+    """volume of a seismic attribute of another volume that computes the attribute only for the slices requested from
+    it and keeps them in a bounded LRU cache. Inline and crossline slices are computed from whole traces, depth slices
+    and sub-volumes from the samples within a halo around them"""
+
+    def __init__(self, volume, attribute, window=RMS_WINDOW, cache_bytes=ATTRIBUTE_CACHE_BYTES):
+        """initializes the attribute volume
+
+        Parameters
+        ----------
+        volume: array or SliceVolume
+            amplitude volume of the form inlines x crosslines x samples
+        attribute: str
+            one of ATTRIBUTES except 'amplitude'
+        window: int
+            length in samples of the sliding window of the RMS amplitude
+        cache_bytes: int
+            memory budget of the cache of computed slices in bytes
+        """
+
+        if attribute not in ATTRIBUTES or attribute == 'amplitude':
+            raise ValueError('attribute must be one of {}, got {}'.format(ATTRIBUTES[1:], attribute))
+
+        self.volume = volume
+        self.attribute = attribute
+        self.window = max(int(window), 1)
+
+        # samples on either side of a sample needed to compute the attribute at it
+        self.halo = self.window // 2 if attribute == 'rms' else HILBERT_HALO
+
+        super().__init__(volume.shape, np.float32, cache_bytes)
+
+    @property
+    def prefetch_axes(self):
+        """axes along which the wrapped volume, and thus the attribute, can be read ahead"""
+        return getattr(self.volume, 'prefetch_axes', SliceVolume.prefetch_axes)
+
+    def compute(self, traces):
+        return compute_attribute(traces, self.attribute, self.window)
+
+    @timed('attributes.slice')
+    def read_inline(self, il):
+        return self.compute(self.volume[il])
+
+    @timed('attributes.slice')
+    def read_crossline(self, xl):
+        return self.compute(self.volume[:, xl])
+
+    @timed('attributes.slice')
+    def read_depth(self, z):
+        return self.read_subvolume(slice(None), slice(None), slice(z, z + 1))[:, :, 0]
+
+    def read_subvolume(self, il_slice, xl_slice, z_slice):
+        """function computes the attribute of the sub-volume from the samples it spans plus the halo around them.
+        Inlines are processed in blocks, so that only the samples of one block are read and transformed at a time"""
+        il_range = range(*il_slice.indices(self.shape[0]))
+        n_xl = len(range(*xl_slice.indices(self.shape[1])))
+        start, stop, step = z_slice.indices(self.shape[2])
+        out = np.zeros((len(il_range), n_xl, len(range(start, stop, step))), dtype=self.dtype)
+        if out.size == 0:
+            return out
+
+        lo = max(start - self.halo, 0)
+        hi = min(stop + self.halo, self.shape[2])
+        chunk_inlines = max(ATTRIBUTE_CHUNK_BYTES // (16 * n_xl * (hi - lo)), 1)
+        for k in range(0, len(il_range), chunk_inlines):
+            block = il_range[k:k + chunk_inlines]
+            block_slice = slice(block.start, block.stop if block.stop >= 0 else None, block.step)
+            values = self.compute(self.volume[block_slice, xl_slice, lo:hi])
+            out[k:k + len(block)] = values[:, :, start - lo:stop - lo:step]
+
+        return out
+
+
+def attribute_stats(slices, attribute, scale=1.0):
+    """function returns the statistics of the attribute values of the given slices, e.g. the slices on display, as a
+    statistics dictionary like the one of the amplitude volume. Envelope and RMS amplitude are clipped around their
+    mean as they are never negative
+
+    Parameters
+    ----------
+    slices: list of array
+        attribute slices to accumulate the statistics of
+    attribute: str
+        one of ATTRIBUTES
+    scale: float
+        amplitude represented by one unit of the stored values of the amplitude volume
+
+    Returns
+    -------
+    stats: dict
+        mean, std, min, max and histogram of the values, together with the scale converting them into amplitudes and
+        the center of the clip range
+    """
+
+    values = np.concatenate([np.asarray(s, dtype=np.float32).ravel() for s in slices])
+    stats = StreamingStats(float(values.min()), float(values.max()))
+    stats.update(values)
+    stats = stats.to_dict()
+
+    stats['scale'] = 1.0 if attribute == 'phase' else scale
+    stats['center'] = stats['mean'] if attribute in ('envelope', 'rms') else 0.0
+    return stats
@@ -0,0 +1,286 @@
+# Script contains a persistent on-disk cache of parsed seismic cubes and their bricked conversions. Every cache entry is
+# a directory of .npy files that are memory-mapped on load, so reopening an unchanged segy file neither re-parses it
+# nor reads the whole cube into memory
+
+import os
+import json
+import shutil
+import hashlib
+import segyio
+import numpy as np
+from pathlib import Path
+from numpy.lib.format import open_memmap
+from utils.geometry import TraceIndex, format_regularity
+from utils.loading import fill_cube_from_segy, fill_cube_parallel, sample_max_amplitude, quantization_scale, \
+    ingest_stats, warn_saturated
+from utils.pyramid import build_pyramid, load_pyramid
+from utils.profiling import timed
+from utils.volume import LazySegyVolume, BrickedVolume, write_bricks, SLICE_CACHE_BYTES
+
+# bump whenever the layout of a cache entry changes so that stale entries are rebuilt
+CACHE_VERSION = 2
+
+# number of bytes at the start of the file (textual, binary and first trace header) hashed into the cache key
+FINGERPRINT_BYTES = 3600 + 240
+
+
+def header_fingerprint(segy_path):
+    """function returns a hash of the file and first trace headers of the segy file"""
+    with open(segy_path, 'rb') as f:
+        return hashlib.sha1(f.read(FINGERPRINT_BYTES)).hexdigest()
+
+
+def cache_key(segy_path, layout='cube'):
+    """function returns the cache key identifying the current state of the segy file by its path, size,
+    modification time and header fingerprint, together with the on-disk layout of the entry"""
+    path = Path(segy_path).resolve()
+    stat = path.stat()
+    identity = '{}|{}|{}|{}|{}|{}'.format(CACHE_VERSION, layout, path, stat.st_size, stat.st_mtime_ns,
+                                          header_fingerprint(path))
+
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def build_cache_entry(segy_path, entry_dir, workers=1, dtype='float32', pyramid=True):
+    """function parses the segy file straight into memory-mapped .npy files inside entry_dir together with its line
+    and sample arrays, the precomputed cube statistics and the coarser levels of its display pyramid, using workers
+    processes to decode traces and storing the cube as dtype. The pyramid is left out if pyramid is False, e.g. for
+    batch exports, and built by load_cached_cube once the entry is displayed"""
+
+    # build entry in a temporary directory so that an interrupted build never leaves a partial entry behind
+    tmp_dir = Path(str(entry_dir) + '.tmp')
+    shutil.rmtree(str(tmp_dir), ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    with segyio.open(str(segy_path), ignore_geometry=True) as segy_file:
+        print("Scanning Segy headers...")
+        trace_index = TraceIndex.from_segy(segy_file)
+        print(format_regularity(trace_index.regularity()))
+
+        samples = np.sort(segy_file.samples)
+        shape = trace_index.shape + (samples.size,)
+        max_abs = sample_max_amplitude(segy_file)
+        scale = quantization_scale(max_abs, dtype)
+        stats = ingest_stats(max_abs, scale)
+
+        # fill the cube directly on disk instead of in memory
+        print("Parsing Segy File into cache...")
+        seismic_cube = open_memmap(str(tmp_dir / 'cube.npy'), mode='w+', dtype=dtype, shape=shape)
+        if workers > 1:
+            fill_cube_parallel(segy_path, trace_index, tmp_dir / 'cube.npy', workers, scale=scale, stats=stats)
+        else:
+            fill_cube_from_segy(segy_file, trace_index, seismic_cube, scale=scale, stats=stats)
+        seismic_cube.flush()
+        print("Segy parsing completed!")
+        warn_saturated(stats, dtype)
+
+    # downsample the cube into the coarser display levels
+    n_levels = write_pyramid(seismic_cube, tmp_dir) if pyramid else None
+    del seismic_cube
+
+    np.save(str(tmp_dir / 'ilines.npy'), trace_index.ilines)
+    np.save(str(tmp_dir / 'xlines.npy'), trace_index.xlines)
+    np.save(str(tmp_dir / 'samples.npy'), samples)
+
+    meta = {'version': CACHE_VERSION,
+            'source': str(Path(segy_path).resolve()),
+            'shape': list(shape),
+            'dtype': dtype,
+            'pyramid_levels': n_levels,
+            'stats': dict(stats.to_dict(), scale=scale)}
+    with open(str(tmp_dir / 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    os.replace(str(tmp_dir), str(entry_dir))
+
+
+def write_pyramid(seismic_cube, entry_dir):
+    """function stores the coarser display levels of the cube in entry_dir and returns their number"""
+    levels = build_pyramid(seismic_cube, entry_dir)
+    for level in levels:
+        level.flush()
+    return len(levels)
+
+
+def cached_cube_dir(segy_path, cache_dir, rebuild=False, workers=1, dtype='float32', pyramid=True):
+    """function returns the directory of the cache entry holding the cube of the segy file, parsing the file into the
+    cache first if it has no valid entry yet. The display pyramid is only built with a new entry if pyramid is True.
+    See load_cached_cube for the other parameters"""
+
+    entry_dir = Path(cache_dir) / cache_key(segy_path, layout='cube-{}'.format(dtype))
+
+    if rebuild and entry_dir.exists():
+        shutil.rmtree(str(entry_dir))
+
+    if not (entry_dir / 'meta.json').is_file():
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+        build_cache_entry(segy_path, entry_dir, workers, dtype, pyramid)
+    else:
+        print("Loading cached cube from {}".format(entry_dir))
+
+    # mark entry as recently used for size-based eviction
+    os.utime(str(entry_dir / 'meta.json'))
+
+    return entry_dir
+
+
+@timed('load.cached_cube')
+def load_cached_cube(segy_path, cache_dir, rebuild=False, workers=1, dtype='float32', return_pyramid=False):
+    """function returns the seismic cube of the segy file from the cache, parsing the file into the cache first if it
+    has no valid entry yet
+
+    Parameters
+    ----------
+    segy_path: str
+        path to the segy file
+    cache_dir: str
+        directory holding the cache entries
+    rebuild: bool
+        if True, the cache entry is rebuilt even if a valid one exists
+    workers: int
+        number of processes decoding traces in parallel when the entry is built
+    dtype: str
+        storage data type of the cube, one of STORAGE_DTYPES
+    return_pyramid: bool
+        if True, the coarser levels of the display pyramid are returned as well
+
+    Returns
+    -------
+    seismic_cube: array
+        read-only memory-mapped 3D array of the form inlines x crosslines x samples
+    ilines: array
+        array of sorted unique inline numbers in the segy file
+    xlines: array
+        array of sorted unique xline numbers in the segy file
+    samples: array
+        array of time/depth samples in segy file
+    stats: dict
+        statistics of the cube accumulated while parsing (mean, std, min, max, histogram) in stored units, together
+        with the quantization scale converting stored units into amplitudes
+    levels: list of array
+        read-only memory-mapped pyramid levels 1, 2, ... of the cube, only returned if return_pyramid is True
+    """
+
+    entry_dir = cached_cube_dir(segy_path, cache_dir, rebuild, workers, dtype)
+
+    with open(str(entry_dir / 'meta.json')) as f:
+        meta = json.load(f)
+
+    seismic_cube = np.load(str(entry_dir / 'cube.npy'), mmap_mode='r')
+    ilines = np.load(str(entry_dir / 'ilines.npy'))
+    xlines = np.load(str(entry_dir / 'xlines.npy'))
+    samples = np.load(str(entry_dir / 'samples.npy'))
+
+    if return_pyramid:
+        if meta['pyramid_levels'] is None:
+            # entry built without the pyramid, e.g. by a batch export
+            print("Building display pyramid of cached cube...")
+            meta['pyramid_levels'] = write_pyramid(seismic_cube, entry_dir)
+            with open(str(entry_dir / 'meta.json.tmp'), 'w') as f:
+                json.dump(meta, f, indent=2)
+            os.replace(str(entry_dir / 'meta.json.tmp'), str(entry_dir / 'meta.json'))
+        levels = load_pyramid(entry_dir, meta['pyramid_levels'])
+        return seismic_cube, ilines, xlines, samples, meta['stats'], levels
+
+    return seismic_cube, ilines, xlines, samples, meta['stats']
+
+
+def load_cached_bricks(segy_path, cache_dir, brick_size=64, rebuild=False, cache_bytes=SLICE_CACHE_BYTES,
+                       dtype='float32'):
+    """function returns the segy file as a BrickedVolume from the cache, converting the file into the bricked layout
+    first if it has no valid entry yet
+
+    Parameters
+    ----------
+    segy_path: str
+        path to the segy file
+    cache_dir: str
+        directory holding the cache entries
+    brick_size: int
+        edge length of the cubic bricks
+    rebuild: bool
+        if True, the cache entry is rebuilt even if a valid one exists
+    cache_bytes: int
+        memory budget of the slice cache of the returned volume in bytes
+    dtype: str
+        storage data type of the bricks, one of STORAGE_DTYPES
+
+    Returns
+    -------
+    volume: BrickedVolume
+        volume reading inline, crossline and depth slices from the bricks
+    """
+
+    entry_dir = Path(cache_dir) / cache_key(segy_path, layout='bricks{}-{}'.format(brick_size, dtype))
+
+    if rebuild and entry_dir.exists():
+        shutil.rmtree(str(entry_dir))
+
+    if not (entry_dir / 'meta.json').is_file():
+        # convert in a temporary directory so that an interrupted conversion never leaves a partial entry behind
+        tmp_dir = Path(str(entry_dir) + '.tmp')
+        shutil.rmtree(str(tmp_dir), ignore_errors=True)
+
+        source_volume = LazySegyVolume(segy_path, cache_bytes=0)
+        print("Converting Segy File into {}^3 bricks...".format(brick_size))
+        write_bricks(source_volume, tmp_dir, brick_size, dtype=dtype,
+                     meta={'version': CACHE_VERSION, 'source': str(Path(segy_path).resolve())})
+        source_volume.close()
+        print("Segy conversion completed!")
+
+        os.replace(str(tmp_dir), str(entry_dir))
+    else:
+        print("Loading cached bricks from {}".format(entry_dir))
+
+    # mark entry as recently used for size-based eviction
+    os.utime(str(entry_dir / 'meta.json'))
+
+    return BrickedVolume(entry_dir, cache_bytes)
+
+
+def directory_size(path):
+    """function returns the total size in bytes of all files below path"""
+    return sum(file.stat().st_size for file in Path(path).rglob('*') if file.is_file())
+
+
+def evict_cache(cache_dir, max_bytes, keep=()):
+    """function deletes the least recently used cache entries until the cache occupies at most max_bytes
+
+    Parameters
+    ----------
+    cache_dir: str
+        directory holding the cache entries
+    max_bytes: int
+        size budget of the cache in bytes
+    keep: iterable of str
+        cache keys that must not be evicted, e.g. the entry currently in use
+
+    Returns
+    -------
+    evicted: list of str
+        cache keys of the deleted entries
+    """
+
+    cache_dir = Path(cache_dir)
+    if not cache_dir.is_dir():
+        return []
+
+    # collect complete entries together with their last use time and size
+    entries = []
+    for entry_dir in cache_dir.iterdir():
+        meta_path = entry_dir / 'meta.json'
+        if entry_dir.is_dir() and meta_path.is_file():
+            entries.append((meta_path.stat().st_mtime, entry_dir.name, directory_size(entry_dir)))
+
+    total = sum(size for _, _, size in entries)
+    evicted = []
+    for _, key, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if key in keep:
+            continue
+        shutil.rmtree(str(cache_dir / key))
+        total -= size
+        evicted.append(key)
+
+    return evicted
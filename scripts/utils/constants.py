@@ -0,0 +1,14 @@
+# Script contains the choices of the command line options shared by the loading, export, horizon and attribute modules.
+# It imports nothing, so that parsing the command line does not load segyio or the plotting stack
+
+# data types the seismic cube can be stored in. Integer types store amplitudes quantized by a per-volume scale
+STORAGE_DTYPES = ('float64', 'float32', 'float16', 'int16', 'int8')
+
+# formats slices can be exported in, rendered images or raw slices
+EXPORT_FORMATS = ('png', 'npy')
+
+# statistics of the samples inside the window around a horizon that can be mapped
+HORIZON_STATISTICS = ('mean', 'rms')
+
+# attributes that can be shown, amplitude being the volume itself
+ATTRIBUTES = ('amplitude', 'envelope', 'phase', 'rms')
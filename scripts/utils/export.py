@@ -0,0 +1,305 @@
+# Script contains the headless batch export of inline, crossline and depth slices as PNG images with horizon overlays
+# or as raw .npy tiles. Slices are rendered with the Agg backend by a pool of worker processes that all read the same
+# memory-mapped cube from a cache entry
+
+import os
+import json
+import itertools
+import tempfile
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from utils.cache import cached_cube_dir
+from utils.geometry import select_positions
+from utils.horizons import HorizonPickIndex, load_horizon, load_horizons
+from utils.stats import clip_limits
+from utils.constants import EXPORT_FORMATS
+from utils.profiling import timed
+from utils.visualization import plot_depth_slice, list_files_in_directory
+
+# kinds of slices that can be exported, with the axis of the cube they cut
+SLICE_KINDS = ('inline', 'crossline', 'depth')
+
+# batches per worker process, so that fast workers pick up the work left by slow ones
+BATCHES_PER_WORKER = 4
+
+# memory budget in bytes of the block of depth slices an export worker reads from the cube at a time
+EXPORT_BLOCK_BYTES = 256 * 1024**2
+
+# name and HorizonPickIndex of every horizon to overlay, indexed once per worker process by init_export_worker
+WORKER_HORIZONS = []
+
+
+def cell_extent(x_values, y_values):
+    """function returns the imshow extent placing the pixel centers of an image at the given sorted x and y values,
+    with y increasing downwards"""
+    dx = (x_values[-1] - x_values[0]) / max(x_values.size - 1, 1) or 1
+    dy = (y_values[-1] - y_values[0]) / max(y_values.size - 1, 1) or 1
+    return x_values[0] - dx / 2, x_values[-1] + dx / 2, y_values[-1] + dy / 2, y_values[0] - dy / 2
+
+
+def slice_image(seismic, kind, position):
+    """function returns the slice of the given kind at relative position as an image with samples along its rows
+    for inlines and crosslines, and inlines along its rows for depth slices"""
+    if kind == 'inline':
+        return seismic[position].T
+    if kind == 'crossline':
+        return seismic[:, position].T
+    return plot_depth_slice(seismic, position)
+
+
+def init_export_worker(horizon_paths, ilines, xlines, samples):
+    """function run once by every export worker process when it starts. It loads the horizons to overlay, from their
+    binary sidecar files unless the horizon files changed, and indexes them by the survey geometry, so that batches
+    carry no picks and are not indexed again"""
+    global WORKER_HORIZONS
+    WORKER_HORIZONS = [(Path(path).name, HorizonPickIndex(ilines, xlines, samples, *load_horizon(path)))
+                       for path in horizon_paths]
+
+
+def batch_images(seismic, kind, positions):
+    """function yields the relative position and image of every slice of a batch. Depth slices cut across every
+    trace of the cube, so they are read in blocks of as many slices as fit into EXPORT_BLOCK_BYTES instead of
+    touching every trace once per slice"""
+    if kind != 'depth':
+        for position in positions:
+            yield position, slice_image(seismic, kind, position)
+        return
+
+    n_block = max(EXPORT_BLOCK_BYTES // (seismic.shape[0] * seismic.shape[1] * seismic.dtype.itemsize), 1)
+    for start in range(0, len(positions), n_block):
+        block = np.asarray(seismic[:, :, positions[start:start + n_block]])
+        for k, position in enumerate(positions[start:start + n_block]):
+            yield position, slice_image(block, kind, k)
+
+
+def export_slice_batch(cube_path, kind, positions, ilines, xlines, samples, out_dir, fmt='png', clip=None,
+                       cmap='gray', dpi=100):
+    """function run by each export worker. It opens the memory-mapped cube on its own and writes the slices of the
+    given kind at the relative positions into out_dir, reusing one Agg figure for all PNG images of the batch. The
+    horizons indexed by init_export_worker are drawn on inline and crossline images
+
+    Parameters
+    ----------
+    cube_path: str
+        path to the .npy cube of the form inlines x crosslines x samples
+    kind: str
+        one of SLICE_KINDS
+    positions: array
+        relative positions of the slices along the axis cut by kind
+    ilines: array
+        array of sorted unique inline numbers
+    xlines: array
+        array of sorted unique xline numbers
+    samples: array
+        array of time/depth samples
+    out_dir: str
+        directory to write the slices into
+    fmt: str
+        'png' for rendered images or 'npy' for raw slices in the stored data type
+    clip: tuple, optional
+        (vmin, vmax) color limits of the images
+    cmap: str
+        matplotlib colormap of the images
+    dpi: int
+        resolution of the images
+
+    Returns
+    -------
+    paths: list of str
+        paths of the written files
+    """
+
+    seismic = np.load(cube_path, mmap_mode='r')
+    labels = {'inline': ilines, 'crossline': xlines, 'depth': samples}[kind]
+    paths = []
+
+    if fmt == 'npy':
+        for position, image in batch_images(seismic, kind, positions):
+            path = os.path.join(out_dir, '{}_{:g}.npy'.format(kind, labels[position]))
+            np.save(path, np.ascontiguousarray(image))
+            paths.append(path)
+        return paths
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    # depth slices carry no overlays
+    picks = WORKER_HORIZONS if kind != 'depth' else []
+
+    # lay out the figure once and only swap the data of its artists for every slice
+    if kind == 'depth':
+        extent = cell_extent(xlines, ilines)
+        axis_labels = ('Crossline Numbers', 'Inline Numbers')
+    else:
+        extent = cell_extent(xlines if kind == 'inline' else ilines, samples)
+        axis_labels = ('Crossline Numbers' if kind == 'inline' else 'Inline Numbers', 'Depth')
+
+    figure = Figure(figsize=(8, 6), dpi=dpi)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    vmin, vmax = clip if clip is not None else (None, None)
+    images = batch_images(seismic, kind, positions)
+    position, image = next(images)
+    img = ax.imshow(image, extent=extent, cmap=cmap, vmin=vmin, vmax=vmax, aspect='auto')
+    ax.set_xlabel(axis_labels[0])
+    ax.set_ylabel(axis_labels[1])
+    ax.set_autoscale_on(False)
+    lines = [ax.plot([], [], label=name)[0] for name, _ in picks]
+    if lines:
+        ax.legend(loc='upper right')
+
+    for position, image in itertools.chain([(position, image)], images):
+        img.set_data(image)
+        for line, (_, index) in zip(lines, picks):
+            if kind == 'inline':
+                x, z = index.inline_picks(position)
+                line.set_data(xlines[x], z)
+            else:
+                x, z = index.crossline_picks(position)
+                line.set_data(ilines[x], z)
+        ax.set_title('{} {:g}'.format(kind.capitalize(), labels[position]))
+
+        path = os.path.join(out_dir, '{}_{:g}.png'.format(kind, labels[position]))
+        figure.savefig(path)
+        paths.append(path)
+
+    return paths
+
+
+@timed('export.slices')
+def export_slices(cube_path, ilines, xlines, samples, out_dir, selections, fmt='png', horizon_paths=(), clip=None,
+                  cmap='gray', workers=None):
+    """function exports slices of the memory-mapped cube at cube_path across a pool of worker processes
+
+    Parameters
+    ----------
+    cube_path: str
+        path to the .npy cube of the form inlines x crosslines x samples
+    ilines: array
+        array of sorted unique inline numbers
+    xlines: array
+        array of sorted unique xline numbers
+    samples: array
+        array of time/depth samples
+    out_dir: str
+        directory to write the slices into
+    selections: dict
+        relative positions of the slices to export keyed by slice kind
+    fmt: str
+        one of EXPORT_FORMATS
+    horizon_paths: list of str
+        paths to the horizon files to overlay on inline and crossline images. Every worker process loads and indexes
+        them once when it starts
+    clip: tuple, optional
+        (vmin, vmax) color limits of the images
+    cmap: str
+        matplotlib colormap of the images
+    workers: int, optional
+        number of worker processes. Defaults to the number of CPUs
+
+    Returns
+    -------
+    paths: list of str
+        paths of the written files
+    """
+
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError('fmt must be one of {}, got {}'.format(EXPORT_FORMATS, fmt))
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    # split every selection into batches so that all workers stay busy until the end
+    batches = []
+    for kind, positions in selections.items():
+        n_batches = min(len(positions), workers * BATCHES_PER_WORKER)
+        batches.extend((kind, batch) for batch in np.array_split(np.asarray(positions), max(n_batches, 1))
+                       if batch.size)
+    n_slices = sum(batch.size for _, batch in batches)
+
+    print("Exporting {} slices with {} workers...".format(n_slices, workers))
+    paths = []
+    horizon_paths = [str(path) for path in horizon_paths] if fmt == 'png' else []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_export_worker,
+                             initargs=(horizon_paths, ilines, xlines, samples)) as pool:
+        futures = [pool.submit(export_slice_batch, str(cube_path), kind, batch, ilines, xlines, samples, str(out_dir),
+                               fmt, clip, cmap)
+                   for kind, batch in batches]
+        for future in as_completed(futures):
+            paths.extend(future.result())
+            print("Exported {}/{} slices".format(len(paths), n_slices))
+
+    return sorted(paths)
+
+
+def export_segy_slices(path_segy, out_dir, inlines=None, crosslines=None, depths=None, step=1, fmt='png',
+                       horizon_path=None, cmap=None, clip_mode='std', clip_factor=None, cache_dir=None,
+                       rebuild_cache=False, dtype='float32', workers=None):
+    """function exports slices of the segy file without opening the interactive window. The cube is memory-mapped from
+    its cache entry, which is built in a temporary directory if no cache directory is given
+
+    Parameters
+    ----------
+    path_segy: str
+        path to the segy file
+    out_dir: str
+        directory to write the slices into
+    inlines, crosslines, depths: tuple, optional
+        (first, last) inline numbers, crossline numbers and time/depth values of the slices to export, both inclusive.
+        Slices of a kind are only exported if its range is given
+    step: int
+        export every step-th line or sample within the ranges
+    fmt: str
+        'png' for rendered images with horizon overlays or 'npy' for raw slices
+    horizon_path: str, optional
+        path to a horizon file or a directory of horizon files to overlay on inline and crossline images
+    cmap: str, optional
+        matplotlib colormap of the images, grayscale by default
+    clip_mode: str
+        'std' or 'percentile', see clip_limits
+    clip_factor: float, optional
+        clip value, 3 standard deviations or the 99th percentile by default
+    cache_dir: str, optional
+        directory holding the cache entries
+    rebuild_cache: bool
+        if True, the cache entry is rebuilt even if a valid one exists
+    dtype: str
+        storage data type of the cube, one of STORAGE_DTYPES
+    workers: int, optional
+        number of worker processes parsing the segy file, horizon files and rendering slices. The segy file is parsed
+        by a single process, horizon files and slices by one process per CPU if not given
+
+    Returns
+    -------
+    paths: list of str
+        paths of the written files
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # the display pyramid is not needed to export slices, it is built once the cached cube is displayed
+        entry_dir = cached_cube_dir(path_segy, cache_dir or tmp_dir, rebuild_cache, workers or 1, dtype,
+                                    pyramid=False)
+        with open(str(entry_dir / 'meta.json')) as f:
+            stats = json.load(f)['stats']
+        ilines = np.load(str(entry_dir / 'ilines.npy'))
+        xlines = np.load(str(entry_dir / 'xlines.npy'))
+        samples = np.load(str(entry_dir / 'samples.npy'))
+
+        # select the slices to export by their line numbers and time/depth values
+        selections = {}
+        for kind, values, bounds in zip(SLICE_KINDS, (ilines, xlines, samples), (inlines, crosslines, depths)):
+            if bounds is not None:
+                selections[kind] = select_positions(values, bounds[0], bounds[1], step)
+
+        # parse horizons to overlay in parallel, leaving their binary sidecar files for the export workers to load
+        horizon_paths = []
+        if horizon_path is not None and fmt == 'png':
+            horizon_paths = [horizon_path] if Path(horizon_path).is_file() else list_files_in_directory(horizon_path)
+            load_horizons(horizon_paths, workers)
+
+        if clip_factor is None:
+            clip_factor = 99 if clip_mode == 'percentile' else 3
+        clip = clip_limits(stats, clip_mode, clip_factor)
+
+        return export_slices(entry_dir / 'cube.npy', ilines, xlines, samples, out_dir, selections, fmt, horizon_paths,
+                             clip, cmap or 'gray', workers)
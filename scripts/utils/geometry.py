@@ -0,0 +1,228 @@
+# Script contains the geometry index that maps every trace of a segy file onto its position in the survey grid
+
+import segyio
+import numpy as np
+from utils.profiling import timed
+
+
+def read_trace_headers(segy_file, field, skip=1):
+    """function returns the value of a trace header field for every skip-th trace in segy_file using a single bulk
+    header read instead of one header lookup per trace"""
+    return np.asarray(segy_file.attributes(field)[0:segy_file.tracecount:skip]).astype(int)
+
+
+def select_positions(values, first=None, last=None, step=1):
+    """function returns the relative positions of the sorted line numbers or samples in values that lie between first
+    and last (inclusive), keeping every step-th of them"""
+    first = values.min() if first is None else first
+    last = values.max() if last is None else last
+    return np.nonzero((values >= first) & (values <= last))[0][::step]
+
+
+def contiguous_runs(sorted_values):
+    """function splits an array of sorted integers into (start, stop) ranges of consecutive values"""
+    if sorted_values.size == 0:
+        return []
+    breaks = np.nonzero(np.diff(sorted_values) != 1)[0] + 1
+    starts = np.concatenate(([0], breaks))
+    stops = np.concatenate((breaks, [sorted_values.size]))
+    return [(int(sorted_values[a]), int(sorted_values[b - 1]) + 1) for a, b in zip(starts, stops)]
+
+
+def lookup_line_positions(sorted_unique_lines, trace_lines):
+    """function returns the relative position of every trace line number in the sorted array of unique line numbers
+
+    Parameters
+    ----------
+    sorted_unique_lines: array
+        array of unique line numbers sorted in ascending order
+    trace_lines: array
+        array of absolute line numbers, one per trace
+
+    Returns
+    -------
+    positions: array
+        array of relative line positions, one per trace
+
+    Raises
+    ------
+    ValueError
+        if a trace carries a line number that is not contained in sorted_unique_lines
+    """
+
+    # binary search every trace line number in one vectorized call
+    positions = np.searchsorted(sorted_unique_lines, trace_lines)
+
+    # any trace whose line number is not in the set of unique lines is an error
+    in_bounds = positions < sorted_unique_lines.size
+    found = in_bounds.copy()
+    found[in_bounds] = sorted_unique_lines[positions[in_bounds]] == trace_lines[in_bounds]
+    if not found.all():
+        missing = np.unique(np.asarray(trace_lines)[~found])
+        raise ValueError('{} line number(s) not found in the line set, e.g. {}'.format(missing.size, missing[:5].tolist()))
+
+    return positions
+
+
+class TraceIndex():
+    """index mapping every trace of a segy file onto its (inline, crossline) position in the survey grid"""
+
+    def __init__(self, trace_ilines, trace_xlines, unique_ilines=None, unique_xlines=None):
+        """initializes the index from the inline and crossline header values of every trace
+
+        Parameters
+        ----------
+        trace_ilines: array
+            inline number of every trace in the file, in trace order
+        trace_xlines: array
+            crossline number of every trace in the file, in trace order
+        unique_ilines: array, optional
+            inline numbers spanning the survey grid. Derived from trace_ilines if not provided
+        unique_xlines: array, optional
+            crossline numbers spanning the survey grid. Derived from trace_xlines if not provided
+        """
+
+        self.trace_ilines = np.asarray(trace_ilines, dtype=int)
+        self.trace_xlines = np.asarray(trace_xlines, dtype=int)
+
+        # sorted unique lines spanning the survey grid
+        if unique_ilines is None:
+            unique_ilines = self.trace_ilines
+        if unique_xlines is None:
+            unique_xlines = self.trace_xlines
+        self.ilines = np.unique(np.asarray(unique_ilines, dtype=int))
+        self.xlines = np.unique(np.asarray(unique_xlines, dtype=int))
+
+        # relative grid position of every trace
+        self.iline_idx = lookup_line_positions(self.ilines, self.trace_ilines)
+        self.xline_idx = lookup_line_positions(self.xlines, self.trace_xlines)
+
+        self._trace_table = None
+
+    @classmethod
+    @timed('load.header_scan')
+    def from_segy(cls, segy_file, unique_ilines=None, unique_xlines=None):
+        """function builds the index from the trace headers of an open segy file"""
+        trace_ilines = read_trace_headers(segy_file, segyio.TraceField.INLINE_3D)
+        trace_xlines = read_trace_headers(segy_file, segyio.TraceField.CROSSLINE_3D)
+        return cls(trace_ilines, trace_xlines, unique_ilines, unique_xlines)
+
+    @property
+    def shape(self):
+        """number of inlines and crosslines spanning the survey grid"""
+        return self.ilines.size, self.xlines.size
+
+    @property
+    def tracecount(self):
+        """number of traces in the index"""
+        return self.trace_ilines.size
+
+    def subset(self, il_positions, xl_positions):
+        """function selects the traces lying on the given relative inline and crossline positions of the grid
+
+        Parameters
+        ----------
+        il_positions: array
+            sorted relative positions of the inlines to keep
+        xl_positions: array
+            sorted relative positions of the crosslines to keep
+
+        Returns
+        -------
+        trace_numbers: array
+            sorted numbers of the selected traces in the file
+        index: TraceIndex
+            index of the selected traces on the grid spanned by the kept inlines and crosslines
+        """
+
+        il_mask = np.zeros(self.ilines.size, dtype=bool)
+        il_mask[il_positions] = True
+        xl_mask = np.zeros(self.xlines.size, dtype=bool)
+        xl_mask[xl_positions] = True
+        keep = il_mask[self.iline_idx] & xl_mask[self.xline_idx]
+
+        index = TraceIndex(self.trace_ilines[keep], self.trace_xlines[keep], self.ilines[il_positions],
+                           self.xlines[xl_positions])
+        return np.nonzero(keep)[0], index
+
+    def trace_table(self):
+        """function returns a (nil, nxl) array holding the trace number at every grid position, with -1 marking
+        positions that have no trace. The table is built once and reused on subsequent calls"""
+        if self._trace_table is None:
+            table = np.full(self.shape, -1, dtype=np.int64)
+            table[self.iline_idx, self.xline_idx] = np.arange(self.tracecount)
+            self._trace_table = table
+
+        return self._trace_table
+
+    def last_trace_mask(self):
+        """function returns a boolean mask over the traces that is True for the last trace landing on every grid
+        position, so that duplicate traces resolve the same way no matter in which order traces are written"""
+        flat_idx = self.iline_idx * self.xlines.size + self.xline_idx
+
+        # np.unique returns the first occurrence, so search the reversed trace order
+        _, last_reversed = np.unique(flat_idx[::-1], return_index=True)
+        mask = np.zeros(self.tracecount, dtype=bool)
+        mask[self.tracecount - 1 - last_reversed] = True
+
+        return mask
+
+    def regularity(self):
+        """function reports how regularly the traces populate the survey grid
+
+        Returns
+        -------
+        report: dict
+            dictionary with the following keys:
+            n_traces: number of traces in the file
+            n_ilines: number of inlines spanning the survey grid
+            n_xlines: number of crosslines spanning the survey grid
+            n_bins: number of (inline, crossline) positions spanned by the survey grid
+            n_filled: number of grid positions holding at least one trace
+            fill_fraction: n_filled / n_bins
+            dense: True if every grid position holds at least one trace
+            duplicate_traces: number of traces landing on an already occupied grid position
+            missing_ilines: inline numbers absent from the file within its regular inline increment
+            missing_xlines: crossline numbers absent from the file within its regular crossline increment
+        """
+
+        # count traces landing in every grid position
+        flat_idx = self.iline_idx * self.xlines.size + self.xline_idx
+        counts = np.bincount(flat_idx, minlength=self.ilines.size * self.xlines.size)
+        n_filled = int(np.count_nonzero(counts))
+        duplicate_traces = self.tracecount - n_filled
+
+        return {'n_traces': self.tracecount,
+                'n_ilines': self.ilines.size,
+                'n_xlines': self.xlines.size,
+                'n_bins': counts.size,
+                'n_filled': n_filled,
+                'fill_fraction': n_filled / max(counts.size, 1),
+                'dense': n_filled == counts.size,
+                'duplicate_traces': duplicate_traces,
+                'missing_ilines': find_missing_lines(self.ilines),
+                'missing_xlines': find_missing_lines(self.xlines)}
+
+
+def find_missing_lines(sorted_unique_lines):
+    """function returns the line numbers absent from sorted_unique_lines, assuming lines are regularly spaced at the
+    greatest common divisor of their increments"""
+    if sorted_unique_lines.size < 2:
+        return np.array([], dtype=int)
+
+    increment = np.gcd.reduce(np.diff(sorted_unique_lines))
+    expected_lines = np.arange(sorted_unique_lines[0], sorted_unique_lines[-1] + 1, increment)
+
+    return np.setdiff1d(expected_lines, sorted_unique_lines)
+
+
+def format_regularity(report):
+    """function returns a short human-readable summary of a regularity report returned by TraceIndex.regularity"""
+    if report['dense']:
+        layout = 'dense'
+    else:
+        layout = 'sparse ({:.1%} of bins filled)'.format(report['fill_fraction'])
+
+    return '{} traces on a {} x {} grid: {}, {} duplicate trace(s), {} missing inline(s), {} missing crossline(s)'.format(
+        report['n_traces'], report['n_ilines'], report['n_xlines'], layout, report['duplicate_traces'], report['missing_ilines'].size,
+        report['missing_xlines'].size)
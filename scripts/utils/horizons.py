@@ -0,0 +1,238 @@
+# Script contains functionality to parse horizon pick files, cache the parsed picks in binary sidecar files, and index
+# the picks by the survey geometry once at load time, so that the picks to draw on the current inline/crossline
+# sections can be looked up without touching the full horizon
+
+import os
+import warnings
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from utils.profiling import timed
+
+# name of the hidden directory next to the horizon files holding their parsed binary copies
+HORIZON_CACHE_DIR = '.seiswiz_cache'
+
+
+def parse_horizon_file(horizon_file_path, skip_rows=1):
+    """function parses a whitespace separated horizon text file with the columns inline, crossline and time/depth
+
+    The whole file is converted by numpy's C text parser in one call instead of line by line. Files it cannot parse
+    as a regular table of numbers are handed to np.genfromtxt
+
+    Parameters
+    ----------
+    horizon_file_path: str
+        path to horizon text file
+    skip_rows: int
+        number of leading rows to skip
+
+    Returns
+    -------
+    picks: array
+        (n, 3) integer array of inline, crossline and time/depth picks
+    """
+
+    with open(str(horizon_file_path), 'rb') as f:
+        data = f.read()
+
+    # infer the number of columns from the last row with content and drop the skipped rows
+    n_cols = len(data.rstrip().rsplit(b'\n', 1)[-1].split())
+    rows = data.split(b'\n', skip_rows)
+    body = rows[skip_rows] if len(rows) > skip_rows else b''
+
+    # numpy either raises on a token that is not a number or stops at it with a DeprecationWarning, depending on its
+    # version, so the warning is turned into an error to fall back in both cases
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            values = np.fromstring(body, dtype=np.float64, sep=' ') if body.strip() else np.empty(0)
+    except (ValueError, DeprecationWarning):
+        values = None
+
+    if n_cols < 3 or values is None or values.size % n_cols != 0:
+        # irregular file, fall back to the slow but lenient parser
+        values = np.atleast_2d(np.genfromtxt(str(horizon_file_path)))[skip_rows:]
+        n_cols = values.shape[1] if values.size else 3
+
+        # rows holding tokens that are not numbers are read as NaN and are no valid picks
+        values = values.reshape(-1, n_cols)
+        values = values[~np.isnan(values[:, :3]).any(axis=1)]
+
+    return values.reshape(-1, n_cols)[:, :3].astype(int)
+
+
+def horizon_cache_path(horizon_file_path):
+    """function returns the path of the binary sidecar file caching the parsed picks of a horizon file"""
+    horizon_file_path = Path(horizon_file_path)
+    return horizon_file_path.parent / HORIZON_CACHE_DIR / (horizon_file_path.name + '.npz')
+
+
+@timed('horizons.load_file')
+def load_horizon(horizon_file_path, use_cache=True):
+    """function returns the picks of a horizon file as a list of inline, crossline and time/depth arrays
+
+    Parsed picks are stored in a binary sidecar file keyed by the size and modification time of the horizon file, so
+    the text is parsed again only after the file changes. Caching is skipped silently if the sidecar cannot be written
+    """
+
+    horizon_file_path = Path(horizon_file_path)
+    stat = horizon_file_path.stat()
+    cache_path = horizon_cache_path(horizon_file_path)
+
+    if use_cache and cache_path.is_file():
+        with np.load(str(cache_path)) as cached:
+            if cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+                picks = cached['picks']
+                return [picks[:, 0], picks[:, 1], picks[:, 2]]
+
+    picks = parse_horizon_file(horizon_file_path)
+
+    if use_cache:
+        try:
+            cache_path.parent.mkdir(exist_ok=True)
+            tmp_path = cache_path.with_name(cache_path.name + '.tmp.npz')
+            np.savez(str(tmp_path), picks=picks, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            os.replace(str(tmp_path), str(cache_path))
+        except OSError:
+            pass
+
+    return [picks[:, 0], picks[:, 1], picks[:, 2]]
+
+
+@timed('horizons.load')
+def load_horizons(horizon_file_paths, workers=None, use_cache=True):
+    """function loads several horizon files concurrently across a pool of worker processes
+
+    Parameters
+    ----------
+    horizon_file_paths: list of str
+        paths to horizon text files
+    workers: int, optional
+        number of worker processes. Defaults to the number of CPUs, files are loaded serially if 1
+    use_cache: bool
+        whether to read and write the binary sidecar files
+
+    Returns
+    -------
+    picks_all_hrzs: list
+        picks of every horizon file as returned by load_horizon, in the order of horizon_file_paths
+    """
+
+    workers = min(workers or os.cpu_count() or 1, max(len(horizon_file_paths), 1))
+    if workers <= 1:
+        return [load_horizon(path, use_cache) for path in horizon_file_paths]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(load_horizon, horizon_file_paths, [use_cache] * len(horizon_file_paths)))
+
+
+def within_samples(z_picks, samples):
+    """function returns a mask of the time/depth picks inside the half-open sample range [samples.min(),
+    samples.max()) of the volume, the bound shared by the indexed picks and the rasterized surfaces of a horizon"""
+    return (z_picks >= samples.min()) & (z_picks < samples.max())
+
+
+def group_offsets(sorted_keys, n_keys):
+    """function returns CSR-style offsets such that the entries with key k occupy offsets[k]:offsets[k+1] of the
+    sorted_keys array, for all keys 0..n_keys-1"""
+    return np.searchsorted(sorted_keys, np.arange(n_keys + 1), side='left')
+
+
+class HorizonPickIndex():
+    """horizon picks digitized once onto the survey grid and grouped by inline and by crossline. Each group is stored
+    as a contiguous run of arrays sorted by position along the section, addressed through CSR-style offsets"""
+
+    @timed('horizons.index')
+    def __init__(self, sorted_unique_inlines, sorted_unique_xlines, samples, inline_picks, xline_picks, z_picks):
+        """initializes the index from the raw horizon picks
+
+        Parameters
+        ----------
+        sorted_unique_inlines: array
+            array of all unique inlines in the segy seismic file sorted in ascending order
+        sorted_unique_xlines: array
+            array of all unique xlines in the segy seismic file sorted in ascending order
+        samples: array
+            array of time/depth samples in segy file
+        inline_picks: array
+            array of inline picks in horizon
+        xline_picks: array
+            array of xline picks in horizon
+        z_picks: array
+            array of time/depth picks
+        """
+
+        inline_picks = np.asarray(inline_picks)
+        xline_picks = np.asarray(xline_picks)
+        z_picks = np.asarray(z_picks)
+
+        # look up the line positions of every pick, keeping only picks that lie exactly on a loaded line, so that
+        # picks on lines skipped by a decimated volume are not drawn on their neighbours
+        il_idx = np.searchsorted(sorted_unique_inlines, inline_picks).clip(0, sorted_unique_inlines.size - 1)
+        xl_idx = np.searchsorted(sorted_unique_xlines, xline_picks).clip(0, sorted_unique_xlines.size - 1)
+        mask_valid = (sorted_unique_inlines[il_idx] == inline_picks) & (sorted_unique_xlines[xl_idx] == xline_picks) & \
+                     within_samples(z_picks, samples)
+
+        # digitized positions of the picks along inline and crossline, counting lines from 1
+        ilines_digitized = il_idx[mask_valid] + 1
+        xlines_digitized = xl_idx[mask_valid] + 1
+        z_picks = z_picks[mask_valid].astype(int)
+
+        # digitized positions range from 1 to the number of lines, keep one extra group so that every slider
+        # position has a (possibly empty) group
+        n_il_groups = sorted_unique_inlines.size + 1
+        n_xl_groups = sorted_unique_xlines.size + 1
+
+        # picks grouped by inline, sorted by crossline within each inline
+        order = np.lexsort((xlines_digitized, ilines_digitized))
+        self.il_offsets = group_offsets(ilines_digitized[order], n_il_groups)
+        self.il_group_xlines = xlines_digitized[order]
+        self.il_group_z = z_picks[order]
+
+        # picks grouped by crossline, sorted by inline within each crossline
+        order = np.lexsort((ilines_digitized, xlines_digitized))
+        self.xl_offsets = group_offsets(xlines_digitized[order], n_xl_groups)
+        self.xl_group_ilines = ilines_digitized[order]
+        self.xl_group_z = z_picks[order]
+
+    def section_picks(self, current_inline_num, current_xline_num):
+        """function returns x/y coordinates of the picks to plot on the stitched inline/crossline view at the given
+        slider positions, sorted by x. Only the picks on the current inline and crossline are touched
+
+        Returns
+        -------
+        sorted_x_coords: array
+            array of x-axis coords to plot on section view
+        sorted_y_coords: array
+            array of y-axis coords to plot on section view
+        """
+
+        # inline section picks left of the current crossline
+        start, stop = self.il_offsets[current_inline_num], self.il_offsets[current_inline_num + 1]
+        stop = start + np.searchsorted(self.il_group_xlines[start:stop], current_xline_num, side='left')
+        inline_x = self.il_group_xlines[start:stop]
+        inline_y = self.il_group_z[start:stop]
+
+        # crossline section picks beyond the current inline, shifted to the right of the current crossline
+        start, stop = self.xl_offsets[current_xline_num], self.xl_offsets[current_xline_num + 1]
+        start = start + np.searchsorted(self.xl_group_ilines[start:stop], current_inline_num, side='right')
+        xline_x = self.xl_group_ilines[start:stop] - current_inline_num + current_xline_num
+        xline_y = self.xl_group_z[start:stop]
+
+        # inline picks lie left and crossline picks right of the current crossline, so both halves are already sorted
+        sorted_x_coords = np.concatenate((inline_x, xline_x)).astype(int)
+        sorted_y_coords = np.concatenate((inline_y, xline_y)).astype(int)
+
+        return sorted_x_coords, sorted_y_coords
+
+    def inline_picks(self, il):
+        """function returns the relative crossline positions and time/depth values of the picks on the inline at
+        relative position il, sorted by crossline"""
+        start, stop = self.il_offsets[il + 1], self.il_offsets[il + 2]
+        return self.il_group_xlines[start:stop] - 1, self.il_group_z[start:stop]
+
+    def crossline_picks(self, xl):
+        """function returns the relative inline positions and time/depth values of the picks on the crossline at
+        relative position xl, sorted by inline"""
+        start, stop = self.xl_offsets[xl + 1], self.xl_offsets[xl + 2]
+        return self.xl_group_ilines[start:stop] - 1, self.xl_group_z[start:stop]
@@ -1,86 +1,491 @@
 # Script contains function to convert segy formatted seismic volumes to numpy arrays for processing and visualization
 # in Python
 
+import os
+import time
 import segyio
+import warnings
+import tempfile
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.format import open_memmap
+from utils.geometry import TraceIndex, format_regularity, select_positions, contiguous_runs
+from utils.stats import StreamingStats
+from utils.constants import STORAGE_DTYPES
+from utils.profiling import PROFILER, timed
 
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
 
-def get_segy_crosslines(segy_file, skip):
-    """function returns a list of crosslines for each trace in the provided segy_file using the skip option provided"""
-    return np.array([segy_file.header[i][segyio.TraceField.CROSSLINE_3D] for i in range(0,segy_file.tracecount,skip)])
+# memory budget in bytes of the block of decoded traces scattered into the cube at a time
+CHUNK_BYTES = 64 * 1024**2
 
+# factor applied to the largest amplitude of the trace subsample used to derive the quantization scale, leaving room
+# for amplitudes larger than any in the subsample before they saturate
+QUANTIZATION_HEADROOM = 1.5
 
-def get_segy_inlines(segy_file, skip):
-    """function returns a list of inlines for each trace in the provided segy_file using the skip option provided"""
-    return np.array([segy_file.header[i][segyio.TraceField.INLINE_3D] for i in range(0,segy_file.tracecount,skip)])
 
-def create_cube_from_segy(segy_file, unique_ilines, unique_xlines, samples):
+def chunk_traces(n_samples, itemsize=4):
+    """function returns the number of traces of n_samples samples of itemsize bytes that fit into CHUNK_BYTES"""
+    return max(CHUNK_BYTES // max(n_samples * itemsize, 1), 1)
+
+
+@timed('load.amplitude_sample')
+def sample_max_amplitude(segy_file, n_traces=2000, seed=0):
+    """function returns the largest absolute amplitude of a random subsample of the traces in segy_file"""
+    rng = np.random.RandomState(seed)
+    n_traces = min(n_traces, segy_file.tracecount)
+    trace_numbers = np.sort(rng.choice(segy_file.tracecount, n_traces, replace=False))
+
+    return max(float(np.abs(segy_file.trace.raw[int(t)]).max()) for t in trace_numbers)
+
+
+def quantization_scale(max_abs, dtype):
+    """function returns the amplitude represented by one integer step of dtype so that max_abs, enlarged by
+    QUANTIZATION_HEADROOM, maps onto the largest integer of dtype. Floating point dtypes have a scale of 1 unless
+    max_abs, enlarged by QUANTIZATION_HEADROOM, exceeds their largest finite value, as it may for float16, in which
+    case it is scaled onto that value"""
+
+    dtype = np.dtype(dtype)
+    if max_abs <= 0:
+        return 1.0
+    if dtype.kind == 'f':
+        return max(max_abs * QUANTIZATION_HEADROOM / float(np.finfo(dtype).max), 1.0)
+
+    return max_abs * QUANTIZATION_HEADROOM / np.iinfo(dtype).max
+
+
+def ingest_stats(max_abs, scale=1.0):
+    """function returns empty streaming statistics of stored values whose histogram spans the amplitude range
+    +-max_abs enlarged by QUANTIZATION_HEADROOM, expressed in units of the stored values"""
+    limit = max_abs * QUANTIZATION_HEADROOM / scale
+    return StreamingStats(-limit, limit)
+
+
+def quantize(traces, dtype, scale=1.0, stats=None):
+    """function converts traces to the storage dtype, rounding and clipping amplitudes divided by scale for integer
+    dtypes. Floating point dtypes store amplitudes divided by scale if it is not 1, clipped to their finite range. The
+    number of clipped samples is added to the saturated count of stats if a StreamingStats object is passed"""
+
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        if scale == 1.0 and dtype.itemsize >= 4:
+            return traces.astype(dtype, copy=False)
+        info = np.finfo(dtype)
+        scaled = traces / scale
+    else:
+        info = np.iinfo(dtype)
+        scaled = np.rint(traces / scale)
+
+    if stats is not None:
+        stats.saturated += int(np.count_nonzero((scaled < info.min) | (scaled > info.max)))
+
+    return np.clip(scaled, info.min, info.max, out=scaled).astype(dtype)
+
+
+def warn_saturated(stats, dtype):
+    """function warns if samples exceeded the range of the storage dtype while the cube was filled and were clipped,
+    which happens if the volume holds amplitudes far larger than any in the subsample of sample_max_amplitude"""
+    if stats.saturated:
+        warnings.warn('{} of {} samples exceeded the range of {} and were clipped, store the volume as float32 to keep '
+                      'them'.format(stats.saturated, stats.count, dtype))
+
+
+def fill_cube_from_segy(segy_file, trace_index, seismic_cube, chunk_size=None, scale=1.0, stats=None):
+    """function reads the traces of segy_file in contiguous blocks of chunk_size traces, by default as many as fit
+    into CHUNK_BYTES, and scatters each block into seismic_cube at the grid positions given by trace_index, quantizing
+    amplitudes by scale if the cube has an integer dtype. The stored values are added to stats while they are in
+    memory if a StreamingStats object is passed"""
+
+    chunk_size = chunk_size or chunk_traces(len(segy_file.samples))
+    keep = trace_index.last_trace_mask()
+    durations = np.zeros(3)  # seconds spent decoding traces, filling the cube and accumulating statistics
+    for start in range(0, trace_index.tracecount, chunk_size):
+        stop = min(start + chunk_size, trace_index.tracecount)
+        block_keep = keep[start:stop]
+        tic = time.perf_counter()
+        traces = segy_file.trace.raw[start:stop]
+        toc = time.perf_counter()
+        traces = quantize(traces[block_keep], seismic_cube.dtype, scale, stats)
+        seismic_cube[trace_index.iline_idx[start:stop][block_keep], trace_index.xline_idx[start:stop][block_keep]] = traces
+        durations[:2] += toc - tic, time.perf_counter() - toc
+        if stats is not None:
+            tic = time.perf_counter()
+            stats.update(traces)
+            durations[2] += time.perf_counter() - tic
+
+    PROFILER.add('load.trace_decode', durations[0])
+    PROFILER.add('load.cube_fill', durations[1])
+    if stats is not None:
+        PROFILER.add('load.stats', durations[2])
+
+    return seismic_cube
+
+
+class SharedCube():
+    """cube in shared memory that the ingest worker processes attach to by name and fill in place, so that the filled
+    cube is handed back without copying it. Arrays created from it with np.asarray keep the shared memory mapped until
+    the last of them is garbage collected"""
+
+    def __init__(self, shape, dtype, name=None):
+        """allocates a new cube of the given shape and dtype, or attaches to the cube allocated under name"""
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        if name is None:
+            nbytes = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+            self.block = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            self.block = shared_memory.SharedMemory(name=name)
+
+        # arrays reference this object rather than an exported buffer of the shared memory, which could not be closed
+        # while they exist
+        address = np.frombuffer(self.block.buf, dtype=np.uint8).ctypes.data
+        self.__array_interface__ = {'shape': self.shape, 'typestr': self.dtype.str, 'data': (address, False),
+                                    'version': 3}
+
+    def __reduce__(self):
+        # worker processes attach to the shared memory by name instead of receiving a copy of the cube
+        return SharedCube, (self.shape, self.dtype.str, self.block.name)
+
+
+def open_cube(cube_path):
+    """function opens the cube an ingest worker fills, either a SharedCube or a .npy file memory-mapped for writing"""
+    if isinstance(cube_path, SharedCube):
+        return np.asarray(cube_path)
+    return np.load(str(cube_path), mmap_mode='r+')
+
+
+def fill_shared_cube(shape, dtype, fill):
+    """function allocates a cube of the given shape and dtype, lets ingest worker processes fill it in place by calling
+    fill with the cube to pass to them in place of a cube path, and returns it. The cube is allocated in shared memory,
+    or on Python versions without multiprocessing.shared_memory in a temporary .npy file that is read back"""
+
+    if shared_memory is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cube_path = os.path.join(tmp_dir, 'cube.npy')
+            open_memmap(cube_path, mode='w+', dtype=dtype, shape=shape)
+            fill(cube_path)
+            return np.load(cube_path)
+
+    shared_cube = SharedCube(shape, dtype)
+    try:
+        fill(shared_cube)
+    finally:
+        # the name is not needed once the workers are done, the memory stays mapped as long as the cube is used
+        shared_cube.block.unlink()
+
+    return np.asarray(shared_cube)
+
+
+def fill_cube_range(segy_path, cube_path, iline_idx, xline_idx, keep, start, chunk_size=None, scale=1.0,
+                    hist_range=(-1.0, 1.0)):
+    """function run by each ingest worker. It opens the segy file and the cube on its own, see open_cube, decodes
+    the traces start:start+len(iline_idx) and writes the ones flagged in keep into the cube at their grid positions.
+    Returns the StreamingStats of the written values, with a histogram spanning hist_range"""
+
+    stats = StreamingStats(*hist_range)
+
+    seismic_cube = open_cube(cube_path)
+    with segyio.open(segy_path, ignore_geometry=True) as segy_file:
+        chunk_size = chunk_size or chunk_traces(len(segy_file.samples))
+        for offset in range(0, iline_idx.size, chunk_size):
+            stop = min(offset + chunk_size, iline_idx.size)
+            block_keep = keep[offset:stop]
+            traces = segy_file.trace.raw[start + offset:start + stop]
+            traces = quantize(traces[block_keep], seismic_cube.dtype, scale, stats)
+            seismic_cube[iline_idx[offset:stop][block_keep], xline_idx[offset:stop][block_keep]] = traces
+            stats.update(traces)
+
+    if isinstance(seismic_cube, np.memmap):
+        seismic_cube.flush()
+
+    return stats
+
+
+@timed('load.parallel_fill')
+def fill_cube_parallel(segy_path, trace_index, cube_path, workers, chunk_size=None, scale=1.0, stats=None):
+    """function splits the traces of the segy file into contiguous ranges and lets a pool of worker processes decode
+    them straight into the cube at cube_path, a memory-mapped .npy file or a SharedCube. The statistics accumulated by
+    the workers are merged into stats if a StreamingStats object is passed
+
+    Only the last trace landing on every grid position is written, so the result does not depend on which worker
+    finishes first and matches the serial fill_cube_from_segy
+    """
+
+    keep = trace_index.last_trace_mask()
+    bounds = np.linspace(0, trace_index.tracecount, workers + 1).astype(int)
+    hist_range = (-1.0, 1.0) if stats is None else (stats.hist_min, stats.hist_max)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fill_cube_range, str(segy_path), cube_path, trace_index.iline_idx[start:stop],
+                               trace_index.xline_idx[start:stop], keep[start:stop], int(start), chunk_size, scale,
+                               hist_range)
+                   for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+        # propagate worker errors and merge worker statistics in trace order
+        for future in futures:
+            worker_stats = future.result()
+            if stats is not None:
+                stats.merge(worker_stats)
+
+
+def select_region(trace_index, samples, iline_range=None, xline_range=None, sample_range=None, steps=(1, 1, 1)):
+    """function returns the relative inline, crossline and sample positions of a region of interest of the survey
+
+    Parameters
+    ----------
+    trace_index: TraceIndex
+        geometry index of the full survey
+    samples: array
+        array of time/depth samples in the segy file
+    iline_range: tuple, optional
+        (first, last) inline numbers of the region, both inclusive. All inlines if not given
+    xline_range: tuple, optional
+        (first, last) crossline numbers of the region, both inclusive. All crosslines if not given
+    sample_range: tuple, optional
+        (first, last) time/depth values of the region, both inclusive. All samples if not given
+    steps: tuple of int
+        keep every step-th inline, crossline and sample of the region
+
+    Returns
+    -------
+    il_positions: array
+        relative positions of the selected inlines
+    xl_positions: array
+        relative positions of the selected crosslines
+    z_positions: array
+        relative positions of the selected samples, evenly spaced
+    """
+
+    positions = []
+    for name, values, bounds, step in zip(('inlines', 'crosslines', 'samples'),
+                                          (trace_index.ilines, trace_index.xlines, samples),
+                                          (iline_range, xline_range, sample_range), steps):
+        if int(step) < 1:
+            raise ValueError('steps must be positive, got {} for {}'.format(step, name))
+        bounds = (None, None) if bounds is None else bounds
+        selected = select_positions(values, bounds[0], bounds[1], int(step))
+        if selected.size == 0:
+            raise ValueError('no {} between {} and {} in the segy file, which spans {} to {}'.format(
+                name, bounds[0], bounds[1], values.min(), values.max()))
+        positions.append(selected)
+
+    return tuple(positions)
+
+
+def read_trace_window(segy_file, trace_numbers, window=slice(None)):
+    """function returns the samples inside window of the sorted trace_numbers of segy_file as a 2D array. Every run
+    of consecutive trace numbers is read in one call, reading whole traces if window covers them and only the samples
+    inside window from each trace otherwise"""
+
+    n_samples = len(range(*window.indices(len(segy_file.samples))))
+    whole_traces = n_samples == len(segy_file.samples) and window.indices(n_samples)[2] == 1
+    traces = np.empty((trace_numbers.size, n_samples), dtype=np.float32)
+
+    position = 0
+    for start, stop in contiguous_runs(trace_numbers):
+        if whole_traces:
+            traces[position:position + stop - start] = segy_file.trace.raw[start:stop]
+        else:
+            # sub-trace reads return a shared buffer that has to be copied out before the next trace is read
+            for offset, trace in enumerate(segy_file.trace[start:stop, window]):
+                traces[position + offset] = trace
+        position += stop - start
+
+    return traces
+
+
+@timed('load.region_fill')
+def fill_region_from_segy(segy_file, trace_numbers, iline_idx, xline_idx, seismic_cube, window=slice(None),
+                          chunk_size=None, scale=1.0, stats=None):
+    """function reads the samples inside window of the sorted trace_numbers of segy_file in chunks of chunk_size
+    traces, by default as many as fit into CHUNK_BYTES, and scatters them into seismic_cube at the grid positions
+    iline_idx, xline_idx of every trace, quantizing amplitudes by scale if the cube has an integer dtype. The stored
+    values are added to stats if a StreamingStats object is passed"""
+
+    chunk_size = chunk_size or chunk_traces(len(segy_file.samples))
+    for start in range(0, trace_numbers.size, chunk_size):
+        stop = min(start + chunk_size, trace_numbers.size)
+        traces = quantize(read_trace_window(segy_file, trace_numbers[start:stop], window), seismic_cube.dtype, scale,
+                          stats)
+        seismic_cube[iline_idx[start:stop], xline_idx[start:stop]] = traces
+        if stats is not None:
+            stats.update(traces)
+
+    return seismic_cube
+
+
+def fill_region_range(segy_path, cube_path, trace_numbers, iline_idx, xline_idx, window, chunk_size=None,
+                      scale=1.0, hist_range=(-1.0, 1.0)):
+    """function run by each region ingest worker. It opens the segy file and the cube on its own, see open_cube,
+    and fills the cube with its share of the traces of the region, see fill_region_from_segy. Returns the
+    StreamingStats of the written values, with a histogram spanning hist_range"""
+
+    stats = StreamingStats(*hist_range)
+
+    seismic_cube = open_cube(cube_path)
+    with segyio.open(segy_path, ignore_geometry=True) as segy_file:
+        fill_region_from_segy(segy_file, trace_numbers, iline_idx, xline_idx, seismic_cube, window, chunk_size, scale,
+                              stats)
+    if isinstance(seismic_cube, np.memmap):
+        seismic_cube.flush()
+
+    return stats
+
+
+@timed('load.parallel_fill')
+def fill_region_parallel(segy_path, trace_numbers, iline_idx, xline_idx, cube_path, workers, window=slice(None),
+                         chunk_size=None, scale=1.0, stats=None):
+    """function splits the traces of a region into contiguous shares and lets a pool of worker processes read them
+    straight into the cube at cube_path, a memory-mapped .npy file or a SharedCube. Every grid position must be
+    covered by at most one trace. The statistics accumulated by the workers are merged into stats if a StreamingStats
+    object is passed"""
+
+    bounds = np.linspace(0, trace_numbers.size, workers + 1).astype(int)
+    hist_range = (-1.0, 1.0) if stats is None else (stats.hist_min, stats.hist_max)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fill_region_range, str(segy_path), cube_path, trace_numbers[start:stop],
+                               iline_idx[start:stop], xline_idx[start:stop], window, chunk_size, scale, hist_range)
+                   for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+        # propagate worker errors and merge worker statistics in trace order
+        for future in futures:
+            worker_stats = future.result()
+            if stats is not None:
+                stats.merge(worker_stats)
+
+
+def create_cube_from_segy(segy_file, unique_ilines, unique_xlines, samples, trace_index=None, dtype='float32',
+                          scale=1.0, stats=None):
     """function creates a 3D numpy array containing the seismic cube from the segy file and the list of sorted
-    inlines, crosslines, and depth/time samples"""
+    inlines, crosslines, and depth/time samples. A prebuilt trace_index may be passed to skip the header scan. The
+    cube is stored as dtype, with amplitudes divided by scale for integer dtypes, and its values are accumulated into
+    stats if a StreamingStats object is passed"""
+
+    # map every trace onto its relative inline/crossline position in one vectorized lookup
+    if trace_index is None:
+        trace_index = TraceIndex.from_segy(segy_file, unique_ilines, unique_xlines)
 
     # create numpy array to store seismic volume
-    seismic_cube = np.zeros((unique_ilines.size, unique_xlines.size, samples.size))
+    seismic_cube = np.zeros((unique_ilines.size, unique_xlines.size, samples.size), dtype=dtype)
 
-    # read each trace and put into the appropriate position in the cube
-    for i in range(segy_file.tracecount):
-        # find relative inline position for trace
-        absolute_xline = int(segy_file.header[i][segyio.TraceField.CROSSLINE_3D])
-        relative_xline = np.where(unique_xlines == absolute_xline)[0].item()
+    # scatter traces into their positions in the cube
+    fill_cube_from_segy(segy_file, trace_index, seismic_cube, scale=scale, stats=stats)
 
-        # find relative crossline position for trace
-        absolute_iline = int(segy_file.header[i][segyio.TraceField.INLINE_3D])
-        relative_iline = np.where(unique_ilines == absolute_iline)[0].item()
+    return seismic_cube
 
-        seismic_cube[relative_iline, relative_xline] = segy_file.trace[i]
 
-    return seismic_cube
+def read_region(segy_file, segy_path, trace_index, samples, iline_range=None, xline_range=None, sample_range=None,
+                steps=(1, 1, 1), workers=1, dtype='float32', scale=1.0, stats=None):
+    """function reads the region of interest selected by select_region from the open segy_file into a new cube,
+    closing the file. Only the traces on the selected lines are read, and of those only the selected samples
+
+    Returns
+    -------
+    seismic_cube: array
+        3D array of the form inlines x crosslines x samples holding the region
+    trace_index: TraceIndex
+        index of the traces of the region on the grid spanned by its lines
+    samples: array
+        array of time/depth samples of the region
+    """
+
+    il_positions, xl_positions, z_positions = select_region(trace_index, samples, iline_range, xline_range,
+                                                            sample_range, steps)
+    window = slice(int(z_positions[0]), int(z_positions[-1]) + 1, int(steps[2]))
+    trace_numbers, trace_index = trace_index.subset(il_positions, xl_positions)
+    samples = samples[window]
+
+    # the last trace landing on a grid position wins, as when reading the whole file
+    keep = trace_index.last_trace_mask()
+    trace_numbers = trace_numbers[keep]
+    iline_idx = trace_index.iline_idx[keep]
+    xline_idx = trace_index.xline_idx[keep]
+    shape = trace_index.shape + (samples.size,)
+    print("Reading region of interest of {} x {} x {} samples from {} traces...".format(*shape, trace_numbers.size))
 
+    if workers > 1:
+        segy_file.close()
+        seismic_cube = fill_shared_cube(shape, dtype, lambda cube_path: fill_region_parallel(
+            segy_path, trace_numbers, iline_idx, xline_idx, cube_path, workers, window, scale=scale, stats=stats))
+    else:
+        seismic_cube = np.zeros(shape, dtype=dtype)
+        fill_region_from_segy(segy_file, trace_numbers, iline_idx, xline_idx, seismic_cube, window, scale=scale,
+                              stats=stats)
+        segy_file.close()
+    print("Segy parsing completed!")
 
-def segy2npy(segy_path):
-    """function takes an unstructured segy file and creates a numpy array corresponding to the 3D seismic volume
+    return seismic_cube, trace_index, samples
+
+
+def segy2npy(segy_path, workers=1, dtype='float64', return_stats=False, iline_range=None, xline_range=None,
+             sample_range=None, steps=(1, 1, 1)):
+    """function takes an unstructured segy file and creates a numpy array corresponding to the 3D seismic volume. If
+    a region of interest is given by line and sample ranges or decimation steps, only the traces and samples inside
+    it are read and the returned cube and line and sample arrays cover just the region
 
     Args:
         segy_path (string): path to segy file
+        workers (int): number of processes decoding traces in parallel
+        dtype (string): storage data type of the cube, one of STORAGE_DTYPES. Integer types quantize amplitudes, a
+            warning is issued if any of them saturate
+        return_stats (bool): if True, statistics of the stored values accumulated while parsing are returned as a
+            fifth value
+        iline_range (tuple): (first, last) inline numbers of the region of interest, both inclusive
+        xline_range (tuple): (first, last) crossline numbers of the region of interest, both inclusive
+        sample_range (tuple): (first, last) time/depth values of the region of interest, both inclusive
+        steps (tuple): keep every step-th inline, crossline and sample of the region of interest
 
     Returns:
         numpy_vol (array): 3D numpy array of the form crosslines x inlines x samples representing the seismic volume
         xlines (array): array of sorted unique xline numbers in the segy file
         ilines (array): array of sorted unique inline numbers in the segy file
         samples (array): array of time/depth samples in segy file
+        stats (dict): mean, std, min, max and histogram of the stored values together with the quantization scale
+            converting them into amplitudes (only if return_stats is True)
     """
 
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError('dtype must be one of {}, got {}'.format(STORAGE_DTYPES, dtype))
+
     # read segy file
     segy_file = segyio.open(segy_path, ignore_geometry=True)
 
-    # get a list of all crosslines in the file
-    all_xlines = get_segy_crosslines(segy_file, skip=20)
-    unique_xlines = np.sort(np.unique(all_xlines)).astype(int)
-
-    # get a list of all inlines in the file
-    all_ilines = get_segy_inlines(segy_file, skip=20)
-    unique_ilines = np.sort(np.unique(all_ilines)).astype(int)
+    # read the inline/crossline header of every trace exactly once to build the survey geometry
+    print("Scanning Segy headers...")
+    trace_index = TraceIndex.from_segy(segy_file)
+    print(format_regularity(trace_index.regularity()))
 
     # array of depth\time samples
     samples = np.sort(segy_file.samples)
+    max_abs = sample_max_amplitude(segy_file)
+    scale = quantization_scale(max_abs, dtype)
+    stats = ingest_stats(max_abs, scale)
 
-    try:
+    if (iline_range, xline_range, sample_range) != (None, None, None) or tuple(steps) != (1, 1, 1):
+        seismic_cube, trace_index, samples = read_region(segy_file, segy_path, trace_index, samples, iline_range,
+                                                         xline_range, sample_range, steps, workers, dtype, scale,
+                                                         stats)
+    elif workers > 1:
+        segy_file.close()
+
+        # workers fill the cube in shared memory, which is returned as it is
+        print("Parsing Segy File with {} workers...".format(workers))
+        shape = trace_index.shape + (samples.size,)
+        seismic_cube = fill_shared_cube(shape, dtype, lambda cube_path: fill_cube_parallel(
+            segy_path, trace_index, cube_path, workers, scale=scale, stats=stats))
+        print("Segy parsing completed!")
+    else:
         print("Parsing Segy File...")
-        seismic_cube = create_cube_from_segy(segy_file, unique_ilines, unique_xlines, samples)
+        seismic_cube = create_cube_from_segy(segy_file, trace_index.ilines, trace_index.xlines, samples, trace_index,
+                                             dtype, scale, stats)
         print("Segy parsing completed!")
+    warn_saturated(stats, dtype)
 
-    except ValueError:
-        print("Missed inlines and/or crosslines on the first pass. Re-reading segy file with every trace...")
-
-        # get crosslines
-        all_xlines = get_segy_crosslines(segy_file, skip=1)
-        unique_xlines = np.sort(np.unique(all_xlines)).astype(int)
-
-        # get inlines
-        all_ilines = get_segy_inlines(segy_file, skip=1)
-        unique_ilines = np.sort(np.unique(all_ilines)).astype(int)
-
-        # recreate cube with re-parsed inline/crossline information
-        seismic_cube = create_cube_from_segy(segy_file, unique_ilines, unique_xlines, samples)
-        print("Segy parsing completed!")
+    if return_stats:
+        return seismic_cube, trace_index.ilines, trace_index.xlines, samples, dict(stats.to_dict(), scale=scale)
 
-    return seismic_cube, unique_ilines, unique_xlines, samples
\ No newline at end of file
+    return seismic_cube, trace_index.ilines, trace_index.xlines, samples
@@ -0,0 +1,141 @@
+# Script contains lightweight timing hooks around the stages of loading a survey and of updating the slicer views.
+# Durations are always recorded into a process-wide profiler, which costs two clock reads per stage, so that a summary
+# of where the time went can be printed or collected at any point
+
+import sys
+import time
+import numpy as np
+from functools import wraps
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# number of most recent durations kept per stage to compute latency percentiles from
+MAX_SAMPLES = 10000
+
+
+def peak_rss_mb(children=False):
+    """function returns the peak resident memory in MB of this process, or of its terminated child processes (e.g.
+    parsing workers) if children is True. Returns None where the platform does not report it"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is reported in KB on Linux and in bytes on macOS
+    return usage.ru_maxrss / (1024**2 if sys.platform == 'darwin' else 1024)
+
+
+class StageStats():
+    """durations of the runs of one stage together with the largest growth of the peak memory during a run"""
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=max_samples)
+        self.peak_rss_growth = 0.0
+
+    def add(self, duration, peak_rss_growth=0.0):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.samples.append(duration)
+        self.peak_rss_growth = max(self.peak_rss_growth, peak_rss_growth)
+
+    def to_dict(self):
+        """function returns the run count, total, mean, maximum and percentiles of the durations in seconds and the
+        largest growth of the peak memory during a run in MB"""
+        p50, p95, p99 = np.percentile(np.asarray(self.samples), [50, 95, 99]) if self.samples else (0.0, 0.0, 0.0)
+        return {'count': self.count, 'total_s': self.total, 'mean_s': self.total / max(self.count, 1),
+                'p50_s': float(p50), 'p95_s': float(p95), 'p99_s': float(p99), 'max_s': self.max,
+                'peak_rss_growth_mb': self.peak_rss_growth}
+
+
+class Profiler():
+    """collects the durations of named stages. Stages are timed with the stage context manager, or reported with add
+    when a stage is made up of many small pieces, e.g. the trace reads interleaved with the cube fill"""
+
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    def add(self, name, duration, peak_rss_growth=0.0):
+        """function records one run of the stage name that took duration seconds"""
+        if name not in self.stages:
+            self.stages[name] = StageStats()
+        self.stages[name].add(duration, peak_rss_growth)
+
+    @contextmanager
+    def stage(self, name):
+        """context manager timing the enclosed block as one run of the stage name, together with the growth of the
+        peak memory of the process while the block ran"""
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            rss_after = peak_rss_mb()
+            self.add(name, duration, rss_after - rss_before if rss_before is not None else 0.0)
+
+    def reset(self):
+        self.stages.clear()
+
+    def summary(self):
+        """function returns the statistics of every stage keyed by stage name, together with the peak memory of the
+        process and of its finished worker processes under 'memory'
+
+        Returns
+        -------
+        summary: dict
+            {'stages': {name: {count, total_s, mean_s, p50_s, p95_s, p99_s, max_s, peak_rss_growth_mb}},
+             'memory': {peak_rss_mb, peak_rss_children_mb}}
+        """
+        return {'stages': OrderedDict((name, stats.to_dict()) for name, stats in self.stages.items()),
+                'memory': {'peak_rss_mb': peak_rss_mb(), 'peak_rss_children_mb': peak_rss_mb(children=True)}}
+
+    def format_summary(self):
+        """function returns the summary as a table of stages with their run counts, durations in milliseconds and
+        peak memory growth in MB"""
+        summary = self.summary()
+        lines = ['{:<28}{:>7}{:>12}{:>10}{:>10}{:>10}{:>10}{:>10}'.format('stage', 'count', 'total [ms]', 'p50',
+                                                                          'p95', 'p99', 'max', '+MB')]
+        for name, stats in summary['stages'].items():
+            lines.append('{:<28}{:>7}{:>12.1f}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.1f}'.format(
+                name, stats['count'], stats['total_s'] * 1e3, stats['p50_s'] * 1e3, stats['p95_s'] * 1e3,
+                stats['p99_s'] * 1e3, stats['max_s'] * 1e3, stats['peak_rss_growth_mb']))
+
+        memory = summary['memory']
+        if memory['peak_rss_mb'] is not None:
+            lines.append('peak memory: {:.1f} MB, worker processes: {:.1f} MB'.format(memory['peak_rss_mb'],
+                                                                                      memory['peak_rss_children_mb']))
+        return '\n'.join(lines)
+
+
+# process-wide profiler the timing hooks report to
+PROFILER = Profiler()
+
+
+def get_profiler():
+    """function returns the process-wide profiler holding the durations recorded by the timing hooks"""
+    return PROFILER
+
+
+def stage(name):
+    """function returns a context manager timing the enclosed block as a run of the stage name in the process-wide
+    profiler"""
+    return PROFILER.stage(name)
+
+
+def timed(name):
+    """decorator timing every call of the decorated function as a run of the stage name in the process-wide
+    profiler"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with PROFILER.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
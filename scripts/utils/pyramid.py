@@ -0,0 +1,134 @@
+# Script contains a multi-resolution pyramid of the seismic volume. Every level halves the previous one along all three
+# axes, so that the slicer can show a level with about one data pixel per screen pixel instead of handing the full
+# resolution slices to matplotlib to resample on every draw
+
+import numpy as np
+from pathlib import Path
+from numpy.lib.format import open_memmap
+from utils.profiling import timed
+
+# coarser levels are built while the largest dimension of the next level has at least this many samples
+PYRAMID_MIN_SIZE = 256
+
+# number of inlines of the finer level averaged at a time while building the next level
+PYRAMID_CHUNK_INLINES = 64
+
+
+def downsample_volume(volume, out=None):
+    """function averages blocks of 2 x 2 x 2 samples of volume into the next coarser pyramid level. Odd dimensions are
+    padded by repeating the last sample. Inlines are processed in chunks, so volume may be a memory-mapped cube
+
+    Parameters
+    ----------
+    volume: array
+        3D array of the form inlines x crosslines x samples
+    out: array, optional
+        array of shape ceil(volume.shape / 2) to write the level into, e.g. a memory-mapped .npy file
+
+    Returns
+    -------
+    level: array
+        downsampled volume of the same dtype as volume
+    """
+
+    shape = tuple(-(-n // 2) for n in volume.shape)
+    if out is None:
+        out = np.empty(shape, dtype=volume.dtype)
+    integer = np.issubdtype(volume.dtype, np.integer)
+
+    for start in range(0, volume.shape[0], PYRAMID_CHUNK_INLINES):
+        block = np.asarray(volume[start:start + PYRAMID_CHUNK_INLINES], dtype=np.float32)
+        block = np.pad(block, [(0, n % 2) for n in block.shape], mode='edge')
+        n_il, n_xl, n_z = (n // 2 for n in block.shape)
+        block = block.reshape(n_il, 2, n_xl, 2, n_z, 2).mean(axis=(1, 3, 5))
+        out[start // 2:start // 2 + n_il] = np.round(block) if integer else block
+
+    return out
+
+
+@timed('load.pyramid')
+def build_pyramid(volume, out_dir=None, min_size=PYRAMID_MIN_SIZE):
+    """function builds the coarser levels of the pyramid of volume
+
+    Parameters
+    ----------
+    volume: array
+        full resolution 3D array of the form inlines x crosslines x samples
+    out_dir: str, optional
+        directory to store the levels in as memory-mapped level<k>.npy files. Levels are kept in memory if not given
+    min_size: int
+        no level whose largest dimension is smaller than min_size is built
+
+    Returns
+    -------
+    levels: list of array
+        levels 1, 2, ... of the pyramid, each half the size of the previous one along every axis
+    """
+
+    levels = []
+    level = volume
+    while max(-(-n // 2) for n in level.shape) >= min_size:
+        shape = tuple(-(-n // 2) for n in level.shape)
+        out = None
+        if out_dir is not None:
+            out = open_memmap(str(Path(out_dir) / 'level{}.npy'.format(len(levels) + 1)), mode='w+',
+                              dtype=volume.dtype, shape=shape)
+        level = downsample_volume(level, out)
+        levels.append(level)
+
+    return levels
+
+
+def load_pyramid(level_dir, n_levels):
+    """function returns the levels 1 to n_levels stored by build_pyramid in level_dir as read-only memory maps"""
+    return [np.load(str(Path(level_dir) / 'level{}.npy'.format(k)), mmap_mode='r') for k in range(1, n_levels + 1)]
+
+
+def select_level(n_levels, visible_rows, visible_cols, height_px, width_px):
+    """function returns the coarsest pyramid level that still shows at least one data pixel per screen pixel
+
+    Parameters
+    ----------
+    n_levels: int
+        number of pyramid levels including the full resolution level 0
+    visible_rows: float
+        number of full resolution rows inside the axes limits
+    visible_cols: float
+        number of full resolution columns inside the axes limits
+    height_px: float
+        height of the axes in screen pixels
+    width_px: float
+        width of the axes in screen pixels
+
+    Returns
+    -------
+    level: int
+        index of the pyramid level, 0 being full resolution
+    """
+
+    factor = min(visible_rows / max(height_px, 1), visible_cols / max(width_px, 1))
+    if factor < 2:
+        return 0
+    return int(min(np.floor(np.log2(factor)), n_levels - 1))
+
+
+def level_extent(extent, full_shape, level_shape, factor):
+    """function returns the imshow extent of a 2D slice of a pyramid level, such that its pixels line up with the full
+    resolution slice shown at extent. Padded levels cover slightly more than the full resolution slice
+
+    Parameters
+    ----------
+    extent: tuple
+        (left, right, bottom, top) extent of the full resolution slice
+    full_shape: tuple
+        (rows, columns) of the full resolution slice
+    level_shape: tuple
+        (rows, columns) of the slice at the pyramid level
+    factor: int
+        downsampling factor of the level
+    """
+
+    left, right, bottom, top = extent
+    right = left + (right - left) * level_shape[1] * factor / full_shape[1]
+    bottom = top + (bottom - top) * level_shape[0] * factor / full_shape[0]
+    return left, right, bottom, top
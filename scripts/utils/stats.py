@@ -0,0 +1,132 @@
+# Script contains streaming amplitude statistics accumulated block by block while traces are ingested, so that the
+# statistics used for display never require a second pass over the full seismic volume
+
+import numpy as np
+
+# number of bins of the amplitude histogram used to look up percentiles
+HISTOGRAM_BINS = 2048
+
+# number of amplitudes accumulated at a time, bounding the float64 temporaries of update for any size of block
+STATS_BLOCK_SIZE = 1024**2
+
+
+class StreamingStats():
+    """running mean, standard deviation, minimum, maximum and histogram of the amplitudes passed to update. Blocks are
+    merged with the pairwise update of Chan et al., so statistics accumulated by separate workers can be combined
+    with merge"""
+
+    def __init__(self, hist_min, hist_max, bins=HISTOGRAM_BINS):
+        """initializes empty statistics
+
+        Parameters
+        ----------
+        hist_min: float
+            lower edge of the histogram. Smaller amplitudes are counted in the first bin
+        hist_max: float
+            upper edge of the histogram. Larger amplitudes are counted in the last bin
+        bins: int
+            number of histogram bins
+        """
+
+        if not hist_max > hist_min:
+            hist_min, hist_max = hist_min - 1.0, hist_min + 1.0
+        self.hist_min = float(hist_min)
+        self.hist_max = float(hist_max)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+        self.min = np.inf
+        self.max = -np.inf
+        self.histogram = np.zeros(bins, dtype=np.int64)
+        self.saturated = 0  # number of amplitudes clipped to the range of the storage dtype, counted by quantize
+
+    def update(self, values):
+        """function adds a block of amplitudes to the statistics. The amplitudes are accumulated STATS_BLOCK_SIZE at a
+        time, so that only float64 copies of a sub-block are ever made"""
+        values = np.asarray(values).reshape(-1)
+        for start in range(0, values.size, STATS_BLOCK_SIZE):
+            self.update_block(values[start:start + STATS_BLOCK_SIZE].astype(np.float64))
+
+    def update_block(self, block):
+        """function adds a float64 sub-block of amplitudes to the statistics, reusing its memory for the histogram"""
+        block_mean = block.mean()
+        deviations = block - block_mean
+        self.combine(block.size, block_mean, np.dot(deviations, deviations))
+        self.min = min(self.min, block.min())
+        self.max = max(self.max, block.max())
+
+        # turn the amplitudes into histogram bin positions in place
+        bins = self.histogram.size
+        block -= self.hist_min
+        block *= bins / (self.hist_max - self.hist_min)
+        np.clip(block, 0, bins - 1, out=block)
+        self.histogram += np.bincount(block.astype(np.intp), minlength=bins)
+
+    def combine(self, count, mean, m2):
+        """function merges the moments of another set of amplitudes into the running moments"""
+        total = self.count + count
+        if total == 0:
+            return
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def merge(self, other):
+        """function merges statistics accumulated separately, e.g. by another ingest worker, into these statistics.
+        Both must share the same histogram range and number of bins"""
+        self.combine(other.count, other.mean, other.m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.histogram += other.histogram
+        self.saturated += other.saturated
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.m2 / self.count)) if self.count else 0.0
+
+    def to_dict(self):
+        """function returns the statistics as a json-serializable dictionary"""
+        return {'mean': float(self.mean), 'std': self.std, 'min': float(self.min), 'max': float(self.max),
+                'count': int(self.count), 'hist_range': [self.hist_min, self.hist_max],
+                'histogram': self.histogram.tolist(), 'saturated': int(self.saturated)}
+
+
+def amplitude_percentile(stats, q):
+    """function returns the approximate q-th percentile of the amplitudes summarized by a statistics dictionary
+    returned by StreamingStats.to_dict, interpolating linearly within histogram bins
+
+    Parameters
+    ----------
+    stats: dict
+        statistics dictionary holding histogram, hist_range, min and max
+    q: float or array
+        percentile(s) between 0 and 100
+
+    Returns
+    -------
+    value: float or array
+        amplitude(s) below which q percent of the amplitudes fall
+    """
+
+    histogram = np.asarray(stats['histogram'], dtype=np.float64)
+    edges = np.linspace(stats['hist_range'][0], stats['hist_range'][1], histogram.size + 1)
+    cumulative = np.concatenate(([0.0], np.cumsum(histogram)))
+    cumulative /= max(cumulative[-1], 1.0)
+
+    value = np.interp(np.asarray(q, dtype=np.float64) / 100, cumulative, edges)
+
+    # edge bins also hold amplitudes clipped into them, keep the result within the observed amplitudes
+    return np.clip(value, stats['min'], stats['max'])
+
+
+def clip_limits(stats, clip_mode, clip_factor):
+    """function returns the color limits clipping the values summarized by a statistics dictionary, either at
+    -clip_factor to clip_factor standard deviations around the center of the statistics, zero unless given otherwise
+    (clip_mode 'std'), or at the 100 - clip_factor and clip_factor percentiles (clip_mode 'percentile')"""
+    if clip_mode == 'percentile':
+        vmin, vmax = amplitude_percentile(stats, [100 - clip_factor, clip_factor])
+        return float(vmin), float(vmax)
+
+    center = stats.get('center', 0.0)
+    return center - clip_factor*stats['std'], center + clip_factor*stats['std']
@@ -0,0 +1,161 @@
+# Script contains horizons rasterized once onto the survey grid as dense surfaces with a validity mask, and the
+# vectorized extraction of amplitudes along them. Horizon amplitude maps and horizon-flattened slices are gathered from
+# the volume with one fancy indexing operation per block of inlines instead of one lookup per pick
+
+import numpy as np
+from utils.constants import HORIZON_STATISTICS
+from utils.horizons import within_samples
+from utils.profiling import timed
+
+# number of inlines of the volume gathered from at a time, bounding the memory of the gathered windows
+SURFACE_CHUNK_INLINES = 64
+
+
+def sample_positions(samples, z_values):
+    """function converts time/depth values into fractional positions along the sorted samples axis, clamping values
+    outside of the samples to the first and last sample"""
+    return np.interp(z_values, samples, np.arange(samples.size, dtype=np.float64))
+
+
+class HorizonSurface():
+    """horizon picks rasterized onto the (inlines, crosslines) grid of the survey as a dense array of time/depth values
+    and of fractional sample positions, together with a mask of the grid positions holding a pick"""
+
+    @timed('horizons.rasterize')
+    def __init__(self, sorted_unique_inlines, sorted_unique_xlines, samples, inline_picks, xline_picks, z_picks):
+        """initializes the surface from the raw horizon picks. Picks on lines that are not part of the grid, e.g.
+        outside of a region of interest or on skipped lines of a decimated volume, are dropped, and of several picks
+        on the same grid position the last one is kept
+
+        Parameters
+        ----------
+        sorted_unique_inlines: array
+            array of all unique inlines of the volume sorted in ascending order
+        sorted_unique_xlines: array
+            array of all unique xlines of the volume sorted in ascending order
+        samples: array
+            array of time/depth samples of the volume
+        inline_picks: array
+            array of inline picks in horizon
+        xline_picks: array
+            array of xline picks in horizon
+        z_picks: array
+            array of time/depth picks
+        """
+
+        inline_picks = np.asarray(inline_picks)
+        xline_picks = np.asarray(xline_picks)
+        z_picks = np.asarray(z_picks, dtype=np.float64)
+
+        # look up the grid position of every pick, keeping only picks that lie exactly on a grid line
+        il_idx = np.searchsorted(sorted_unique_inlines, inline_picks).clip(0, sorted_unique_inlines.size - 1)
+        xl_idx = np.searchsorted(sorted_unique_xlines, xline_picks).clip(0, sorted_unique_xlines.size - 1)
+        on_grid = (sorted_unique_inlines[il_idx] == inline_picks) & (sorted_unique_xlines[xl_idx] == xline_picks) & \
+                  within_samples(z_picks, samples)
+
+        shape = (sorted_unique_inlines.size, sorted_unique_xlines.size)
+        self.z = np.zeros(shape, dtype=np.float64)
+        self.mask = np.zeros(shape, dtype=bool)
+        self.z[il_idx[on_grid], xl_idx[on_grid]] = z_picks[on_grid]
+        self.mask[il_idx[on_grid], xl_idx[on_grid]] = True
+
+        # fractional sample position of the horizon at every grid position, 0 where there is no pick
+        self.positions = np.where(self.mask, sample_positions(samples, self.z), 0.0)
+
+    @property
+    def shape(self):
+        """number of inlines and crosslines of the grid"""
+        return self.mask.shape
+
+    @property
+    def coverage(self):
+        """fraction of the grid positions holding a pick"""
+        return self.mask.mean() if self.mask.size else 0.0
+
+    def reference_position(self):
+        """function returns the median sample position of the horizon, i.e. the depth slice a flattened volume aligns
+        the horizon with"""
+        if not self.mask.any():
+            return 0
+        return int(np.rint(np.median(self.positions[self.mask])))
+
+    def at_level(self, factor):
+        """function returns the sample positions and validity mask of the surface on the grid of the pyramid level
+        downsampled by factor along every axis"""
+        if factor == 1:
+            return self.positions, self.mask
+        return self.positions[::factor, ::factor] / factor, self.mask[::factor, ::factor]
+
+
+@timed('horizons.extract')
+def extract_horizon_map(volume, positions, mask, offset=0, window=0, statistic='mean', out=None):
+    """function gathers the samples of volume inside a window around a horizon at every grid position and reduces
+    them to a map. With the default window of 0 the map holds the amplitudes along the horizon, and shifting it by
+    offset samples gives a horizon-flattened depth slice
+
+    Parameters
+    ----------
+    volume: array or SliceVolume
+        3D volume of the form inlines x crosslines x samples
+    positions: array
+        (nil, nxl) fractional sample positions of the horizon, see HorizonSurface.at_level
+    mask: array
+        (nil, nxl) boolean array of the grid positions holding a pick
+    offset: float
+        number of samples to shift the horizon down by before extracting
+    window: int
+        half-length in samples of the window around the shifted horizon. Samples of the window outside of the volume
+        are left out of the statistic
+    statistic: str
+        one of HORIZON_STATISTICS, the mean or the root mean square of the samples inside the window
+    out: array, optional
+        (nil, nxl) float32 array to write the map into
+
+    Returns
+    -------
+    horizon_map: array
+        (nil, nxl) float32 map in the units of the stored values, NaN where there is no pick or the window lies outside
+        of the volume
+    """
+
+    if statistic not in HORIZON_STATISTICS:
+        raise ValueError('statistic must be one of {}, got {}'.format(HORIZON_STATISTICS, statistic))
+
+    nil, nxl, nz = volume.shape
+    window = int(window)
+    if out is None:
+        out = np.empty((nil, nxl), dtype=np.float32)
+    out.fill(np.nan)
+
+    centers = np.rint(positions + offset).astype(np.int64)
+    taps = np.arange(-window, window + 1)
+
+    for start in range(0, nil, SURFACE_CHUNK_INLINES):
+        stop = min(start + SURFACE_CHUNK_INLINES, nil)
+        il, xl = np.nonzero(mask[start:stop])
+        if il.size == 0:
+            continue
+
+        # sample indices of the window at every pick, leaving out those outside of the volume
+        indices = centers[start:stop][il, xl][:, None] + taps
+        inside = (indices >= 0) & (indices < nz)
+        counts = inside.sum(axis=1)
+        if not counts.any():
+            continue
+
+        # read only the samples spanned by the windows of this block of inlines, then gather all windows at once
+        z0 = int(max(indices.min(), 0))
+        z1 = int(min(indices.max() + 1, nz))
+        block = np.asarray(volume[start:stop, :, z0:z1])
+        values = block[il[:, None], xl[:, None], indices.clip(z0, z1 - 1) - z0].astype(np.float32)
+        values[~inside] = 0
+
+        if statistic == 'rms':
+            reduced = np.sqrt(np.einsum('ij,ij->i', values, values) / np.maximum(counts, 1))
+        else:
+            reduced = values.sum(axis=1) / np.maximum(counts, 1)
+
+        found = counts > 0
+        out[start + il[found], xl[found]] = reduced[found]
+
+    return out
@@ -0,0 +1,146 @@
+# Script contains generators of synthetic SEG-Y files and matching horizon files of configurable size and irregularity,
+# used to benchmark the parsing, slicing and horizon code on surveys of known geometry
+
+import segyio
+import numpy as np
+from pathlib import Path
+
+# byte offsets (1-based, as in the SEG-Y standard) of the header fields written by write_synthetic_segy
+TEXT_HEADER_BYTES = 3200
+BINARY_HEADER_BYTES = 400
+TRACE_HEADER_BYTES = 240
+
+
+def synthetic_horizon_depths(ilines, xlines, base, amplitude, seed=0):
+    """function returns a smooth, gently dipping (len(ilines), len(xlines)) surface of time/depth values around base"""
+    rng = np.random.RandomState(seed)
+    phase_il, phase_xl = rng.uniform(0, 2 * np.pi, 2)
+    u = (ilines - ilines.min())[:, None] / max(np.ptp(ilines), 1)
+    v = (xlines - xlines.min())[None, :] / max(np.ptp(xlines), 1)
+    return base + amplitude * (np.sin(2 * np.pi * u + phase_il) * np.cos(3 * np.pi * v + phase_xl) + 0.5 * (u - v))
+
+
+def synthetic_traces(n_traces, n_samples, horizons, sample_rate, seed=0):
+    """function returns (n_traces, n_samples) float32 traces of random noise with a strong reflection at the
+    time/depth of every horizon in horizons, given as an (n_horizons, n_traces) array"""
+    rng = np.random.RandomState(seed)
+    traces = 0.1 * rng.randn(n_traces, n_samples).astype(np.float32)
+    times = np.arange(n_samples, dtype=np.float32) * sample_rate
+    for depths in horizons:
+        # Ricker-like wavelet centred on the horizon
+        t = (times[None, :] - depths[:, None]) / (4 * sample_rate)
+        traces += ((1 - 2 * t ** 2) * np.exp(-t ** 2)).astype(np.float32)
+    return traces
+
+
+def write_synthetic_segy(segy_path, n_ilines=200, n_xlines=300, n_samples=500, sample_rate=4.0, first_iline=1000,
+                         first_xline=2000, xline_step=1, missing_traces=0.0, missing_ilines=0, missing_xlines=0,
+                         shuffle=False, n_horizons=0, horizon_dir=None, chunk_size=65536, seed=0):
+    """function writes a synthetic 3D post-stack SEG-Y file and optionally matching horizon files
+
+    The file is written directly from numpy byte arrays rather than trace by trace through segyio, so that surveys
+    of millions of traces are generated in seconds. Only the header fields read by SeisWiz are filled in
+
+    Parameters
+    ----------
+    segy_path: str
+        path of the SEG-Y file to write
+    n_ilines, n_xlines, n_samples: int
+        size of the regular grid the survey is cut from
+    sample_rate: float
+        sample interval in milliseconds
+    first_iline, first_xline: int
+        numbers of the first inline and crossline
+    xline_step: int
+        increment between consecutive crossline numbers
+    missing_traces: float
+        fraction of traces dropped at random positions
+    missing_ilines, missing_xlines: int
+        number of whole interior inlines and crosslines dropped, creating gaps in the line numbering
+    shuffle: bool
+        if True, traces are written in random order instead of sorted by inline and crossline
+    n_horizons: int
+        number of horizon files to write into horizon_dir. Every horizon is also imprinted on the traces
+    horizon_dir: str, optional
+        directory to write the horizon files into, defaults to the directory of segy_path
+    chunk_size: int
+        number of traces generated and written at a time
+    seed: int
+        seed of the random generator
+
+    Returns
+    -------
+    info: dict
+        number of traces written, grid shape, and paths of the horizon files
+    """
+
+    rng = np.random.RandomState(seed)
+    ilines = first_iline + np.arange(n_ilines)
+    xlines = first_xline + np.arange(n_xlines) * xline_step
+
+    # drop interior lines and random traces
+    keep = np.ones((n_ilines, n_xlines), dtype=bool)
+    if missing_ilines:
+        keep[rng.choice(np.arange(1, n_ilines - 1), missing_ilines, replace=False)] = False
+    if missing_xlines:
+        keep[:, rng.choice(np.arange(1, n_xlines - 1), missing_xlines, replace=False)] = False
+    keep &= rng.rand(n_ilines, n_xlines) >= missing_traces
+
+    positions = np.nonzero(keep.ravel())[0]
+    if shuffle:
+        rng.shuffle(positions)
+
+    # horizons follow smooth surfaces in the middle of the trace
+    duration = n_samples * sample_rate
+    surfaces = [synthetic_horizon_depths(ilines, xlines, duration * (k + 1) / (n_horizons + 1),
+                                         duration / (4 * (n_horizons + 1)), seed + k)
+                for k in range(n_horizons)]
+
+    trace_bytes = TRACE_HEADER_BYTES + 4 * n_samples
+    binary_header = np.zeros(BINARY_HEADER_BYTES, dtype=np.uint8)
+    put_field(binary_header, segyio.BinField.Interval - TEXT_HEADER_BYTES, int(sample_rate * 1000), '>i2')
+    put_field(binary_header, segyio.BinField.Samples - TEXT_HEADER_BYTES, n_samples, '>i2')
+    put_field(binary_header, segyio.BinField.Format - TEXT_HEADER_BYTES, 5, '>i2')  # IEEE float
+
+    with open(str(segy_path), 'wb') as f:
+        f.write(b'\x40' * TEXT_HEADER_BYTES)  # blank EBCDIC textual header
+        f.write(binary_header.tobytes())
+
+        for start in range(0, positions.size, chunk_size):
+            chunk = positions[start:start + chunk_size]
+            il_idx, xl_idx = np.unravel_index(chunk, keep.shape)
+            records = np.zeros((chunk.size, trace_bytes), dtype=np.uint8)
+
+            headers = records[:, :TRACE_HEADER_BYTES]
+            put_field(headers, segyio.TraceField.TRACE_SEQUENCE_FILE, start + 1 + np.arange(chunk.size), '>i4')
+            put_field(headers, segyio.TraceField.INLINE_3D, ilines[il_idx], '>i4')
+            put_field(headers, segyio.TraceField.CROSSLINE_3D, xlines[xl_idx], '>i4')
+            put_field(headers, segyio.TraceField.TRACE_SAMPLE_COUNT, n_samples, '>i2')
+            put_field(headers, segyio.TraceField.TRACE_SAMPLE_INTERVAL, int(sample_rate * 1000), '>i2')
+
+            records[:, TRACE_HEADER_BYTES:].view('>f4')[:] = synthetic_traces(chunk.size, n_samples, [s[il_idx, xl_idx] for s in surfaces],
+                                               sample_rate, seed + start)
+            records.tofile(f)
+
+    # write horizons on the full grid as integer inline, crossline and time/depth columns below a header row
+    horizon_paths = []
+    horizon_dir = Path(horizon_dir) if horizon_dir is not None else Path(segy_path).parent
+    horizon_dir.mkdir(parents=True, exist_ok=True)
+    il_grid, xl_grid = np.meshgrid(ilines, xlines, indexing='ij')
+    for k, surface in enumerate(surfaces):
+        path = horizon_dir / 'horizon_{}.txt'.format(k)
+        picks = np.column_stack((il_grid.ravel(), xl_grid.ravel(), np.round(surface).astype(int).ravel()))
+        np.savetxt(str(path), picks, fmt='%d', header='inline crossline time', comments='')
+        horizon_paths.append(str(path))
+
+    return {'n_traces': int(positions.size), 'shape': [n_ilines, n_xlines, n_samples],
+            'horizon_paths': horizon_paths}
+
+
+def put_field(headers, byte, values, dtype):
+    """function writes big-endian values into the header field starting at the 1-based byte of every row of a uint8
+    header array"""
+    dtype = np.dtype(dtype)
+    values = np.ascontiguousarray(np.broadcast_to(np.asarray(values, dtype=dtype), headers.shape[:-1]))
+    field = values.reshape(-1).view(np.uint8).reshape(values.shape + (dtype.itemsize,))
+    headers[..., byte - 1:byte - 1 + dtype.itemsize] = field
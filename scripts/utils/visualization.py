@@ -1,18 +1,70 @@
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
+import matplotlib
 from matplotlib.widgets import Slider
 from pathlib import Path
+from utils.horizons import HorizonPickIndex
 
 
-def plot_section_slices(array, x_pos, y_pos):
-    """function returns an image consisting of stitched slices in il and xl directions for seismic volume array"""
-    h1, w1 = array[0].T.shape  # height and width of orthogonal slices along first axis
-    _, w2 = array[:,0,:].T.shape  # height and width of orthogonal slices along second axis
+def plot_section_slices(array, x_pos, y_pos, out=None):
+    """function returns an image consisting of stitched slices in il and xl directions for seismic volume array. The
+    image is written into out if given, otherwise a new image of the volume's dtype is allocated"""
+    w2, w1, h1 = array.shape  # height and width of orthogonal slices along first and second axes
 
-    image_stitched = np.zeros((h1, w1+w2))
-    image_stitched[:,:y_pos] = array[x_pos,:y_pos].T
-    image_stitched[:, y_pos:y_pos+w2-x_pos] = array[x_pos:,y_pos,:].T
-    return image_stitched
+    if out is None:
+        out = np.empty((h1, w1+w2), dtype=array.dtype)
+    fill_section_inline(array, x_pos, y_pos, out)
+    fill_section_crossline(array, x_pos, y_pos, out, clear_end=out.shape[1])
+    return out
+
+
+def fill_section_inline(array, x_pos, y_pos, out, start=0):
+    """function copies the inline half of the stitched section, i.e. crosslines start to y_pos of inline x_pos, into
+    the columns start to y_pos of the section image out"""
+    out[:, start:y_pos] = array[x_pos, start:y_pos].T
+
+
+def fill_section_crossline(array, x_pos, y_pos, out, clear_end=0):
+    """function copies the crossline half of the stitched section, i.e. inlines x_pos onwards of crossline y_pos,
+    into the section image out and zeroes the columns after it up to clear_end left over from a previous section.
+    Returns the column after the crossline half"""
+    end = y_pos + array.shape[0] - x_pos
+    out[:, y_pos:end] = array[x_pos:, y_pos].T
+    out[:, end:clear_end] = 0
+    return end
+
+
+class StitchedSection():
+    """stitched inline/crossline section image kept in one preallocated buffer of the volume's dtype. Moving the
+    slider positions rewrites only the parts of the buffer that changed instead of building a new image per frame"""
+
+    def __init__(self, array, x_pos=0, y_pos=0):
+        """initializes the buffer and fills it with the section at the given inline and crossline positions"""
+        nil, nxl, nz = array.shape
+        self.array = array
+        self.image = np.zeros((nz, nil + nxl), dtype=array.dtype)
+        self.x_pos = x_pos
+        self.y_pos = y_pos
+        fill_section_inline(array, x_pos, y_pos, self.image)
+        self.end = fill_section_crossline(array, x_pos, y_pos, self.image)
+
+    def update(self, x_pos, y_pos):
+        """function moves the section to the given inline and crossline positions and returns the buffer
+
+        The inline half is refilled only if the inline changed, or extended by the newly uncovered crosslines if only
+        the crossline moved right. The crossline half shifts with both positions and is refilled whenever one moved"""
+
+        if x_pos != self.x_pos:
+            fill_section_inline(self.array, x_pos, y_pos, self.image)
+        elif y_pos > self.y_pos:
+            fill_section_inline(self.array, x_pos, y_pos, self.image, start=self.y_pos)
+
+        if (x_pos, y_pos) != (self.x_pos, self.y_pos):
+            self.end = fill_section_crossline(self.array, x_pos, y_pos, self.image, clear_end=self.end)
+
+        self.x_pos = x_pos
+        self.y_pos = y_pos
+        return self.image
 
 
 def plot_depth_slice(array, z_pos):
@@ -22,7 +74,8 @@ def plot_depth_slice(array, z_pos):
 
 def extract_section_picks(sorted_unique_inlines, sorted_unique_xlines, samples, inline_picks, xline_picks, z_picks,
                           current_inline_num, current_xline_num):
-    """function returns indices of horizon picks to plot on stitched inline/crossline view of the 2D slicer
+    """function returns indices of horizon picks to plot on stitched inline/crossline view of the 2D slicer. When
+    picks are looked up repeatedly for the same horizon, build a HorizonPickIndex once and query it instead
 
     Parameters
     ----------
@@ -45,57 +98,8 @@ def extract_section_picks(sorted_unique_inlines, sorted_unique_xlines, samples,
         array of y-axis coords to plot on section view
     """
 
-    # generate mask of valid picks to plot on seismic
-    mask_valid = (inline_picks >= sorted_unique_inlines.min()) & (inline_picks <= sorted_unique_inlines.max()) & \
-                 (xline_picks >= sorted_unique_xlines.min()) & (xline_picks <= sorted_unique_xlines.max()) & \
-                 (z_picks < samples.max())
-
-    # filter out picks not contained within survey geometry
-    inline_picks = inline_picks[mask_valid]
-    xline_picks = xline_picks[mask_valid]
-    z_picks = z_picks[mask_valid]
-
-    # digitize picks along inline and crossline
-    ilines_digitized = np.digitize(inline_picks, bins=sorted_unique_inlines)
-    xlines_digitized = np.digitize(xline_picks, bins=sorted_unique_xlines)
-
-    # create arrays to store x and y coordinates of picks
-    x_coords = []  # to store x positions of horizon picks
-    y_coords = []  # to store y positions of horizon picks
-
-    # subsample picks for current inline
-    mask_valid = (ilines_digitized == current_inline_num)
-
-    # add inline section picks
-    for x_pick, y_pick in zip(xlines_digitized[mask_valid].tolist(), z_picks[mask_valid].tolist()):
-        if x_pick < current_xline_num:
-            x_coords.append(x_pick)
-            y_coords.append(y_pick)
-        else:
-            pass
-
-    # subsample picks for current xline
-    mask_valid = (xlines_digitized == current_xline_num)
-
-    # add xline section picks to x_coords
-    for x_pick, y_pick in zip(ilines_digitized[mask_valid].tolist(), z_picks[mask_valid].tolist()):
-        if x_pick > current_inline_num:
-            x_coords.append(x_pick - current_inline_num + current_xline_num)
-            y_coords.append(y_pick)
-        else:
-            pass
-
-    # convert lists to numpy arrays
-    x_coords = np.array(x_coords, dtype=int)
-    y_coords = np.array(y_coords, dtype=int)
-
-    # sort by x values
-    sorting_inds_x = np.argsort(x_coords)
-    sorted_x_coords = x_coords[sorting_inds_x]
-    sorted_y_coords = y_coords[sorting_inds_x]
-
-    return sorted_x_coords, sorted_y_coords
-
+    return HorizonPickIndex(sorted_unique_inlines, sorted_unique_xlines, samples, inline_picks, xline_picks,
+                            z_picks).section_picks(current_inline_num, current_xline_num)
 
 
 def create_section_sliders(nil, nxl, nz, init_vals=(0,0,0)):
@@ -113,6 +117,8 @@ def create_section_sliders(nil, nxl, nz, init_vals=(0,0,0)):
             tuple specifying the initial frame values along inline, crossline, and depth directions
         """
 
+    import matplotlib.pyplot as plt
+
     # Add slider for interactive frame navigation along inline direction
     axframe1 = plt.axes([0.1, 0.01, 0.5, 0.03], facecolor='lightgoldenrodyellow')
     frame_slider1 = Slider(axframe1, 'Inline Num', 0, nil - 1, valinit=init_vals[0], valstep=1)
@@ -128,12 +134,17 @@ def create_section_sliders(nil, nxl, nz, init_vals=(0,0,0)):
     return frame_slider1, frame_slider2, frame_slider3
 
 
-def create_clip_slider():
-    """function creates and returns a slider object to manipulate the clipping applied to the seismic images in terms
-    of its standard deviation"""
+def create_clip_slider(mode='std'):
+    """function creates and returns a slider object to manipulate the clipping applied to the seismic images either in
+    terms of its standard deviation (mode='std') or of the amplitude percentile to saturate at (mode='percentile')"""
+
+    import matplotlib.pyplot as plt
 
     clip_axis = plt.axes([0.7, 0.06, 0.25, 0.03], facecolor='lightgoldenrodyellow')
-    clip_slider = Slider(clip_axis, 'Clip', 1, 10, valinit=3, valstep=1)
+    if mode == 'percentile':
+        clip_slider = Slider(clip_axis, 'Clip %', 90, 100, valinit=99, valstep=0.1)
+    else:
+        clip_slider = Slider(clip_axis, 'Clip', 1, 10, valinit=3, valstep=1)
 
     return clip_slider
 
@@ -146,3 +157,22 @@ def list_files_in_directory(directory_path):
 
     return files
 
+
+def detect_render_mode():
+    """function returns 'notebook' when running inside a Jupyter kernel with the static inline backend, where every
+    frame has to be pushed to the notebook output, and 'script' otherwise, where the figure canvas redraws itself"""
+
+    # IPython is only inspected if it is already running, never imported just to find out
+    ipython = sys.modules.get('IPython')
+    shell = ipython.get_ipython() if ipython is not None else None
+    if shell is None or 'IPKernelApp' not in getattr(shell, 'config', {}):
+        return 'script'
+
+    return 'notebook' if 'inline' in matplotlib.get_backend().lower() else 'script'
+
+
+def show_in_notebook(fig):
+    """function shows the figure in the notebook output and returns the display handle to replace it with later
+    frames"""
+    from IPython.display import display
+    return display(fig, display_id=True)
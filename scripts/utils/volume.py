@@ -0,0 +1,503 @@
+# Script contains an out-of-core seismic volume that reads traces from the segy file on demand. It mimics the indexing
+# interface of the 3D numpy cube used by the slicer so that it can be passed wherever the cube is expected
+
+import json
+import segyio
+import threading
+import numpy as np
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from numpy.lib.format import open_memmap
+from utils.geometry import TraceIndex, format_regularity, contiguous_runs
+from utils.loading import quantization_scale, quantize, ingest_stats, warn_saturated, read_trace_window, chunk_traces
+from utils.profiling import timed
+
+# default memory budget of the slice cache in bytes
+SLICE_CACHE_BYTES = 512 * 1024**2
+
+# default number of slices loaded ahead of the slider in its direction of travel, and their memory budget in bytes
+PREFETCH_SLICES = 4
+PREFETCH_BYTES = 128 * 1024**2
+
+
+class SliceCache():
+    """least recently used cache of 2D slices bounded by the total number of bytes it holds. The cache is shared with
+    the prefetch threads, every access holds its lock"""
+
+    def __init__(self, max_bytes=SLICE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._slices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._slices
+
+    def __len__(self):
+        return len(self._slices)
+
+    def get(self, key):
+        """function returns the slice stored under key and marks it as most recently used, or None if absent"""
+        with self._lock:
+            if key not in self._slices:
+                return None
+            self._slices.move_to_end(key)
+            return self._slices[key]
+
+    def put(self, key, array):
+        """function stores array under key, evicting least recently used slices to stay within the budget"""
+        # cached slices are shared between callers, guard them against in-place modification
+        array.flags.writeable = False
+
+        with self._lock:
+            if key in self._slices:
+                self.nbytes -= self._slices.pop(key).nbytes
+
+            self._slices[key] = array
+            self.nbytes += array.nbytes
+
+            # always keep the newest slice, even if it alone exceeds the budget
+            while self.nbytes > self.max_bytes and len(self._slices) > 1:
+                _, evicted = self._slices.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._slices.clear()
+            self.nbytes = 0
+
+
+def normalize_index(index, size):
+    """function converts a possibly negative integer index into a positive one, raising IndexError if out of range"""
+    index = int(index)
+    if not -size <= index < size:
+        raise IndexError('index {} is out of bounds for axis with size {}'.format(index, size))
+    return index % size
+
+
+class SliceVolume():
+    """base class of out-of-core volumes of the form inlines x crosslines x samples. Subclasses implement reading of
+    single inline, crossline and depth slices and of sub-volumes, this class adds the LRU slice cache and the
+    numpy-style indexing interface used by plot_section_slices and plot_depth_slice"""
+
+    # axes along which slices are cheap enough to be read ahead of the sliders by a SlicePrefetcher
+    prefetch_axes = ('il', 'xl', 'z')
+
+    def __init__(self, shape, dtype, cache_bytes=SLICE_CACHE_BYTES):
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.cache = SliceCache(cache_bytes)
+        self._loading = {}  # events of slices currently being read, keyed like the cache
+        self._loading_lock = threading.Lock()
+
+    @property
+    def ndim(self):
+        return 3
+
+    def __len__(self):
+        return self.shape[0]
+
+    def read_inline(self, il):
+        raise NotImplementedError
+
+    def read_crossline(self, xl):
+        raise NotImplementedError
+
+    def read_depth(self, z):
+        raise NotImplementedError
+
+    def read_subvolume(self, il_slice, xl_slice, z_slice):
+        raise NotImplementedError
+
+    def cached_slice(self, key, reader, position):
+        """function returns the slice stored in the cache under key, reading it with reader(position) on a miss. If
+        another thread, e.g. the prefetcher, is already reading the slice, the read is awaited instead of repeated"""
+        section = self.cache.get(key)
+        if section is not None:
+            return section
+
+        with self._loading_lock:
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = self._loading[key] = threading.Event()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            loading.wait()
+            section = self.cache.get(key)
+            if section is not None:
+                return section
+
+        try:
+            section = reader(position)
+            self.cache.put(key, section)
+        finally:
+            if owner:
+                with self._loading_lock:
+                    del self._loading[key]
+                loading.set()
+
+        return section
+
+    def inline_slice(self, il):
+        """function returns the (nxl, nz) inline slice at relative inline position il"""
+        return self.cached_slice(('il', il), self.read_inline, il)
+
+    def crossline_slice(self, xl):
+        """function returns the (nil, nz) crossline slice at relative crossline position xl"""
+        return self.cached_slice(('xl', xl), self.read_crossline, xl)
+
+    def depth_slice(self, z):
+        """function returns the (nil, nxl) depth slice at relative sample position z"""
+        return self.cached_slice(('z', z), self.read_depth, z)
+
+    def __getitem__(self, key):
+        """function supports numpy-style indexing with integers and slices along the three axes"""
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 3:
+            raise IndexError('too many indices for volume: volume is 3-dimensional, but {} were indexed'.format(len(key)))
+        key = key + (slice(None),) * (3 - len(key))
+        shape = self.shape
+
+        # serve the request from a cached slice along the first integer-indexed axis
+        if not isinstance(key[0], slice):
+            return self.inline_slice(normalize_index(key[0], shape[0]))[key[1:]]
+        if not isinstance(key[1], slice):
+            return self.crossline_slice(normalize_index(key[1], shape[1]))[(key[0], key[2])]
+        if not isinstance(key[2], slice):
+            return self.depth_slice(normalize_index(key[2], shape[2]))[key[:2]]
+
+        # sub-volume request, read uncached
+        return self.read_subvolume(*key)
+
+
+class LazySegyVolume(SliceVolume):
+    """seismic volume that reads only the traces of the segy file needed for the requested inline, crossline or depth
+    slice and keeps recently used slices in a bounded LRU cache"""
+
+    # a depth slice scans every trace of the file, so reading it ahead would hold the file for the inline and
+    # crossline slices on display
+    prefetch_axes = ('il', 'xl')
+
+    def __init__(self, segy_path, cache_bytes=SLICE_CACHE_BYTES):
+        """initializes the volume by scanning the trace headers of the segy file
+
+        Parameters
+        ----------
+        segy_path: str
+            path to segy file
+        cache_bytes: int
+            memory budget of the slice cache in bytes
+        """
+
+        self.segy_file = segyio.open(str(segy_path), ignore_geometry=True)
+        self.io_lock = threading.Lock()  # the segy file handle is shared with the prefetch threads
+
+        print("Scanning Segy headers...")
+        self.trace_index = TraceIndex.from_segy(self.segy_file)
+        print(format_regularity(self.trace_index.regularity()))
+
+        self.trace_table = self.trace_index.trace_table()
+        self.ilines = self.trace_index.ilines
+        self.xlines = self.trace_index.xlines
+        self.samples = np.sort(self.segy_file.samples)
+
+        super().__init__(self.trace_index.shape + (self.samples.size,), np.float32, cache_bytes)
+
+    def close(self):
+        self.segy_file.close()
+
+    def read_traces(self, trace_numbers, window=slice(None)):
+        """function returns a (len(trace_numbers), n) array of the samples inside window of the requested traces,
+        reading runs of consecutive trace numbers in one call each and only the samples inside window of every trace
+        if it does not cover whole traces"""
+        traces = np.zeros((trace_numbers.size, len(range(*window.indices(self.shape[2])))), dtype=self.dtype)
+
+        order = np.argsort(trace_numbers, kind='stable')
+        sorted_numbers = trace_numbers[order]
+        position = 0
+        for start, stop in contiguous_runs(sorted_numbers):
+            with self.io_lock:
+                run = read_trace_window(self.segy_file, np.arange(start, stop), window)
+            traces[order[position:position + stop - start]] = run
+            position += stop - start
+
+        return traces
+
+    def read_grid_traces(self, trace_grid, window=slice(None)):
+        """function returns the samples inside window of the traces at every position of an array of trace numbers,
+        filling positions without a trace (marked by -1) with zeros"""
+        out = np.zeros(trace_grid.shape + (len(range(*window.indices(self.shape[2]))),), dtype=self.dtype)
+        valid = trace_grid >= 0
+        out[valid] = self.read_traces(trace_grid[valid], window)
+        return out
+
+    def read_inline(self, il):
+        return self.read_grid_traces(self.trace_table[il])
+
+    def read_crossline(self, xl):
+        return self.read_grid_traces(self.trace_table[:, xl])
+
+    def read_depth(self, z):
+        """function reads every trace in the file in contiguous chunks but keeps only one sample per trace"""
+        section = np.zeros(self.shape[:2], dtype=self.dtype)
+        chunk_size = chunk_traces(self.shape[2])
+        for start in range(0, self.trace_index.tracecount, chunk_size):
+            stop = min(start + chunk_size, self.trace_index.tracecount)
+            with self.io_lock:
+                chunk = self.segy_file.trace.raw[start:stop]
+            section[self.trace_index.iline_idx[start:stop], self.trace_index.xline_idx[start:stop]] = chunk[:, z]
+        return section
+
+    def read_subvolume(self, il_slice, xl_slice, z_slice):
+        """function reads only the samples inside z_slice of the traces of the sub-volume"""
+        return self.read_grid_traces(self.trace_table[il_slice, xl_slice], z_slice)
+
+    @timed('load.stats_estimate')
+    def estimate_stats(self, n_traces=2000, seed=0):
+        """function estimates statistics of the volume from a random subsample of traces
+
+        Returns
+        -------
+        stats: dict
+            dictionary holding the estimated mean, std, min, max and amplitude histogram of the volume
+        """
+        rng = np.random.RandomState(seed)
+        n_traces = min(n_traces, self.trace_index.tracecount)
+        trace_numbers = np.sort(rng.choice(self.trace_index.tracecount, n_traces, replace=False))
+        traces = self.read_traces(trace_numbers)
+
+        stats = ingest_stats(float(np.abs(traces).max()))
+        stats.update(traces)
+
+        return stats.to_dict()
+
+
+class BrickedVolume(SliceVolume):
+    """seismic volume stored as a grid of cubic bricks so that inline, crossline and depth slices all cost about the
+    same amount of I/O. The bricks live in a single memory-mapped .npy file of shape
+    (n_il_bricks, n_xl_bricks, n_z_bricks, brick_size, brick_size, brick_size), written by write_bricks"""
+
+    def __init__(self, brick_dir, cache_bytes=SLICE_CACHE_BYTES):
+        """initializes the volume from a directory written by write_bricks
+
+        Parameters
+        ----------
+        brick_dir: str
+            directory holding bricks.npy, the line and sample arrays and meta.json
+        cache_bytes: int
+            memory budget of the slice cache in bytes
+        """
+
+        brick_dir = Path(brick_dir)
+        with open(str(brick_dir / 'meta.json')) as f:
+            self.meta = json.load(f)
+
+        self.bricks = np.load(str(brick_dir / 'bricks.npy'), mmap_mode='r')
+        self.brick_size = self.bricks.shape[-1]
+        self.ilines = np.load(str(brick_dir / 'ilines.npy'))
+        self.xlines = np.load(str(brick_dir / 'xlines.npy'))
+        self.samples = np.load(str(brick_dir / 'samples.npy'))
+        self.stats = self.meta['stats']
+
+        super().__init__(self.meta['shape'], self.bricks.dtype, cache_bytes)
+
+    def read_inline(self, il):
+        b = self.brick_size
+        nb_il, nb_xl, nb_z = self.bricks.shape[:3]
+        section = np.asarray(self.bricks[il // b, :, :, il % b])  # (nb_xl, nb_z, b, b)
+        section = section.transpose(0, 2, 1, 3).reshape(nb_xl * b, nb_z * b)
+        return np.ascontiguousarray(section[:self.shape[1], :self.shape[2]])
+
+    def read_crossline(self, xl):
+        b = self.brick_size
+        nb_il, nb_xl, nb_z = self.bricks.shape[:3]
+        section = np.asarray(self.bricks[:, xl // b, :, :, xl % b])  # (nb_il, nb_z, b, b)
+        section = section.transpose(0, 2, 1, 3).reshape(nb_il * b, nb_z * b)
+        return np.ascontiguousarray(section[:self.shape[0], :self.shape[2]])
+
+    def read_depth(self, z):
+        b = self.brick_size
+        nb_il, nb_xl, nb_z = self.bricks.shape[:3]
+        section = np.asarray(self.bricks[:, :, z // b, :, :, z % b])  # (nb_il, nb_xl, b, b)
+        section = section.transpose(0, 2, 1, 3).reshape(nb_il * b, nb_xl * b)
+        return np.ascontiguousarray(section[:self.shape[0], :self.shape[1]])
+
+    def read_subvolume(self, il_slice, xl_slice, z_slice):
+        """function reads only the bricks overlapping the sub-volume and cuts the sub-volume out of them"""
+        b = self.brick_size
+        ranges = [range(*s.indices(n)) for s, n in zip((il_slice, xl_slice, z_slice), self.shape)]
+        if any(len(r) == 0 for r in ranges):
+            return np.zeros(tuple(len(r) for r in ranges), dtype=self.dtype)
+
+        # span of bricks covering the first to the last index along every axis
+        first = [min(r[0], r[-1]) // b for r in ranges]
+        last = [max(r[0], r[-1]) // b + 1 for r in ranges]
+        bricks = np.asarray(self.bricks[first[0]:last[0], first[1]:last[1], first[2]:last[2]])
+        n_il, n_xl, n_z = bricks.shape[:3]
+        block = bricks.transpose(0, 3, 1, 4, 2, 5).reshape(n_il * b, n_xl * b, n_z * b)
+
+        return block[np.ix_(*[np.asarray(r) - f * b for r, f in zip(ranges, first)])]
+
+
+class SlicePrefetcher():
+    """loads the slices ahead of the current slider positions into the slice cache of a volume on background threads.
+    The slices are predicted from the direction and stride of the last move along each axis, predictions invalidated
+    by a later move are cancelled before they are read"""
+
+    def __init__(self, volume, n_slices=PREFETCH_SLICES, max_bytes=PREFETCH_BYTES, workers=2):
+        """initializes the prefetcher
+
+        Parameters
+        ----------
+        volume: SliceVolume
+            volume whose slice cache is filled ahead of time
+        n_slices: int
+            number of slices to load ahead along the axis that moved
+        max_bytes: int
+            memory budget in bytes of the slices loaded ahead along one axis. It is additionally capped at half the
+            slice cache of the volume, so that prefetched slices never evict the slices on display
+        workers: int
+            number of threads reading slices
+        """
+
+        self.volume = volume
+        self.n_slices = n_slices
+        self.max_bytes = max_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        nil, nxl, nz = volume.shape
+        itemsize = volume.dtype.itemsize
+        readers = {'il': volume.inline_slice, 'xl': volume.crossline_slice, 'z': volume.depth_slice}
+        self.readers = {axis: readers[axis] for axis in volume.prefetch_axes}
+        self.sizes = {'il': nil, 'xl': nxl, 'z': nz}
+        self.slice_bytes = {'il': nxl * nz * itemsize, 'xl': nil * nz * itemsize, 'z': nil * nxl * itemsize}
+
+        self.positions = {}  # last observed position along every axis
+        self.strides = {}  # signed stride of the last move along every axis
+        self.targets = {axis: set() for axis in self.readers}  # positions currently worth loading along every axis
+        self.pending = {}  # futures of scheduled slice reads keyed like the slice cache
+        self.lock = threading.RLock()
+
+    def observe(self, axis, position):
+        """function records the slider position along axis ('il', 'xl' or 'z') and schedules loading the next slices
+        in the direction of travel, cancelling scheduled reads of slices that are no longer ahead. Moves along axes
+        the volume is not prefetched along are ignored"""
+
+        if axis not in self.readers:
+            return
+
+        last = self.positions.get(axis, position)
+        if position != last:
+            self.strides[axis] = position - last
+        self.positions[axis] = position
+        stride = self.strides.get(axis, 1)
+
+        budget = min(self.max_bytes, self.volume.cache.max_bytes // 2)
+        n_slices = min(self.n_slices, budget // max(self.slice_bytes[axis], 1))
+        targets = [position + stride * k for k in range(1, n_slices + 1)]
+        targets = [target for target in targets if 0 <= target < self.sizes[axis]]
+
+        with self.lock:
+            self.targets[axis] = set(targets)
+
+            # cancel reads that have not started yet, started ones skip themselves in load
+            for key, future in list(self.pending.items()):
+                if key[0] == axis and key[1] not in self.targets[axis]:
+                    future.cancel()
+
+            for target in targets:
+                key = (axis, target)
+                if key in self.pending or key in self.volume.cache:
+                    continue
+                future = self.executor.submit(self.load, axis, target)
+                self.pending[key] = future
+                future.add_done_callback(lambda future, key=key: self.discard(key, future))
+
+    def load(self, axis, position):
+        """function reads a slice into the cache unless it stopped being a prefetch target in the meantime"""
+        if position in self.targets[axis]:
+            self.readers[axis](position)
+
+    def discard(self, key, future):
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    def close(self):
+        """function cancels all scheduled reads and stops the threads once the running reads finished"""
+        with self.lock:
+            for axis in self.targets:
+                self.targets[axis] = set()
+            for future in list(self.pending.values()):
+                future.cancel()
+        self.executor.shutdown(wait=False)
+
+
+@timed('load.brick_conversion')
+def write_bricks(source_volume, brick_dir, brick_size=64, meta=None, dtype='float32'):
+    """function converts a volume into the bricked layout read by BrickedVolume
+
+    Parameters
+    ----------
+    source_volume: LazySegyVolume
+        volume to convert. Traces are read one column of brick_size x brick_size traces at a time
+    brick_dir: str
+        directory to write bricks.npy, the line and sample arrays and meta.json into
+    brick_size: int
+        edge length of the cubic bricks
+    meta: dict, optional
+        additional entries to store in meta.json
+    dtype: str
+        storage data type of the bricks. Integer types quantize amplitudes by a scale derived from a trace subsample
+
+    Returns
+    -------
+    stats: dict
+        dictionary holding the mean, std, min, max and histogram of the stored values and the quantization scale
+    """
+
+    brick_dir = Path(brick_dir)
+    brick_dir.mkdir(parents=True, exist_ok=True)
+
+    b = brick_size
+    nil, nxl, nz = source_volume.shape
+    n_bricks = (-(-nil // b), -(-nxl // b), -(-nz // b))
+    bricks = open_memmap(str(brick_dir / 'bricks.npy'), mode='w+', dtype=dtype, shape=n_bricks + (b, b, b))
+
+    sample_stats = source_volume.estimate_stats()
+    max_abs = max(abs(sample_stats['min']), abs(sample_stats['max']))
+    scale = quantization_scale(max_abs, dtype)
+    stats = ingest_stats(max_abs, scale)
+    for ib in range(n_bricks[0]):
+        for xb in range(n_bricks[1]):
+            # read one column of traces spanning a brick laterally and the full trace length vertically
+            column = np.zeros((b, b, n_bricks[2] * b), dtype=dtype)
+            traces = quantize(source_volume[ib * b:(ib + 1) * b, xb * b:(xb + 1) * b, :], dtype, scale, stats)
+            column[:traces.shape[0], :traces.shape[1], :nz] = traces
+
+            # split the column into bricks along depth
+            bricks[ib, xb] = column.reshape(b, b, n_bricks[2], b).transpose(2, 0, 1, 3)
+
+            # accumulate statistics of the stored values at grid positions holding a trace
+            stats.update(traces[source_volume.trace_table[ib * b:(ib + 1) * b, xb * b:(xb + 1) * b] >= 0])
+
+    bricks.flush()
+    del bricks
+    warn_saturated(stats, dtype)
+
+    stats = dict(stats.to_dict(), scale=scale)
+
+    np.save(str(brick_dir / 'ilines.npy'), source_volume.ilines)
+    np.save(str(brick_dir / 'xlines.npy'), source_volume.xlines)
+    np.save(str(brick_dir / 'samples.npy'), source_volume.samples)
+    meta = dict(meta or {}, shape=[nil, nxl, nz], brick_size=b, stats=stats)
+    with open(str(brick_dir / 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    return stats